@@ -0,0 +1,210 @@
+import os
+import time
+import asyncio
+import logging
+import numpy as np
+import pandas as pd
+from sqlalchemy import select
+from backend.database import AsyncSessionLocal
+from backend.model import Appeal, Appeal_Status, AppealHistory, Mahalla
+
+
+logger = logging.getLogger(__name__)
+
+
+# columnar computations for /statistics analytics: the router fetches plain rows,
+# everything per appeal / per mekeme happens here as pandas and numpy operations
+
+DONE_STATUSES = (Appeal_Status.SUCCESS_DONE.value, Appeal_Status.TEXT_DONE.value)
+
+PERCENTILES = (50, 90)
+
+
+def hours_between(start, end):
+    return (pd.to_datetime(end) - pd.to_datetime(start)).dt.total_seconds().to_numpy() / 3600
+
+
+def percentiles(values):
+    if not len(values):
+        return {f"p{q}_hours": None for q in PERCENTILES}
+    return {f"p{q}_hours": round(float(value), 1) for q, value in zip(PERCENTILES, np.percentile(values, PERCENTILES))}
+
+
+def resolution_times(rows):
+    # rows: (mekeme_id, created_at, resolved_at), one per resolved appeal
+    frame = pd.DataFrame(rows, columns=['mekeme_id', 'created_at', 'resolved_at'])
+    if frame.empty:
+        return {}
+
+    frame['hours'] = np.clip(hours_between(frame['created_at'], frame['resolved_at']), 0, None)
+
+    result = {}
+    for mekeme_id, hours in frame.groupby('mekeme_id', dropna=False)['hours']:
+        values = hours.to_numpy()
+        result[None if pd.isna(mekeme_id) else int(mekeme_id)] = {"resolved": len(values), **percentiles(values)}
+    return result
+
+
+# ---- status dwell times from AppealHistory ----
+# history.status is the action that was requested; HISTORY_STATE maps it to the status the appeal
+# is in afterwards (time_extended, time_denied and success_50 send it back to in_progress)
+
+HISTORY_STATE = {status.value: status.value for status in Appeal_Status}
+HISTORY_STATE.update({
+    Appeal_Status.TIME_EXTENDED.value: Appeal_Status.IN_PROGRESS.value,
+    Appeal_Status.TIME_DENIED.value: Appeal_Status.IN_PROGRESS.value,
+    Appeal_Status.SUCCESS_50.value: Appeal_Status.IN_PROGRESS.value,
+})
+
+STATES = [status for status in Appeal_Status if status.value in HISTORY_STATE.values()]
+
+SEGMENT_COLUMNS = ['appeal_id', 'status', 'entered_at', 'mekeme_id', 'sector_id']
+
+
+class DwellState:
+    # closed segments (status, hours spent) and the currently open segment of every appeal,
+    # built from history rows with id <= last_id
+
+    def __init__(self):
+        self.last_id = 0
+        self.built_at = time.monotonic()
+        self.open = pd.DataFrame(columns=SEGMENT_COLUMNS)
+        self.segments = pd.DataFrame(columns=SEGMENT_COLUMNS + ['hours'])
+        self.closed = []
+
+    def apply(self, rows):
+        frame = pd.DataFrame(rows, columns=['id'] + SEGMENT_COLUMNS)
+        last_id = int(frame['id'].max())
+        frame['status'] = frame['status'].map(HISTORY_STATE)
+        frame = frame.dropna(subset=['status']).drop(columns='id')
+
+        # open segments go first so each appeal continues where the previous batch stopped
+        combined = pd.concat([df for df in (self.open, frame) if not df.empty], ignore_index=True)
+        if not combined.empty:
+            combined = combined.sort_values('appeal_id', kind='stable')
+            combined = combined[combined.groupby('appeal_id')['status'].shift() != combined['status']]
+
+            left_at = combined.groupby('appeal_id')['entered_at'].shift(-1)
+            closed = combined[left_at.notna()].copy()
+            closed['hours'] = np.clip(hours_between(closed['entered_at'], left_at[left_at.notna()]), 0, None)
+
+            if not closed.empty:
+                self.closed.append(closed)
+            self.open = combined.groupby('appeal_id').tail(1).reset_index(drop=True)
+
+        self.last_id = last_id
+
+    def collect(self):
+        # closed segments of all batches since the last collect(), joined to segments in one concat
+        if self.closed:
+            self.segments = pd.concat([df for df in [self.segments] + self.closed if not df.empty], ignore_index=True)
+            self.closed = []
+
+
+class DwellTimes:
+    # folds history rows with id > last_id into the current DwellState, batch by batch. ids are taken
+    # at insert, so a row that commits after a higher id was folded in, or a moved appeal, is only
+    # picked up by the rebuild: every rebuild_after seconds a background task builds a new state
+    # from scratch and swaps it in, requests keep reading the old one meanwhile
+
+    def __init__(self, batch=50000, rebuild_after=3600):
+        self.batch = batch
+        self.rebuild_after = rebuild_after
+        self._lock = asyncio.Lock()
+        self._rebuild = None
+        self.reset()
+
+    def reset(self):
+        self.state = DwellState()
+
+    @property
+    def last_id(self):
+        return self.state.last_id
+
+    def apply(self, rows):
+        self.state.apply(rows)
+        self.state.collect()
+
+    def query(self, last_id):
+        return (
+            select(AppealHistory.id, AppealHistory.appeal_id, AppealHistory.status, AppealHistory.created_at,
+                   Appeal.mekeme_id, Mahalla.sector_id)
+            .join(Appeal, Appeal.id == AppealHistory.appeal_id)
+            .outerjoin(Mahalla, Mahalla.id == Appeal.mahalla_id)
+            .where(AppealHistory.id > last_id, AppealHistory.status.is_not(None))
+            .order_by(AppealHistory.id)
+            .limit(self.batch)
+        )
+
+    async def fold(self, session, state):
+        while True:
+            rows = (await session.execute(self.query(state.last_id))).all()
+            if rows:
+                await asyncio.to_thread(state.apply, rows)
+            if len(rows) < self.batch:
+                break
+        await asyncio.to_thread(state.collect)
+
+    async def rebuild(self):
+        try:
+            state = DwellState()
+            async with AsyncSessionLocal() as session:
+                await self.fold(session, state)
+
+                # catch up with rows added during the build, then swap
+                async with self._lock:
+                    await self.fold(session, state)
+                    self.state = state
+
+        except Exception as e:
+            logger.error(f"Dwell time rebuild failed: {e}")
+
+        finally:
+            self._rebuild = None
+
+    async def refresh(self, session):
+        if time.monotonic() - self.state.built_at > self.rebuild_after and self._rebuild is None:
+            self._rebuild = asyncio.create_task(self.rebuild())
+
+        async with self._lock:
+            await self.fold(session, self.state)
+
+    def summary(self, mekeme_id=None, sector_id=None, from_date=None, to_date=None):
+        def scoped(frame):
+            mask = np.ones(len(frame), dtype=bool)
+            if mekeme_id is not None:
+                mask &= (frame['mekeme_id'] == mekeme_id).to_numpy()
+            if sector_id is not None:
+                mask &= (frame['sector_id'] == sector_id).to_numpy()
+            if from_date is not None:
+                mask &= (pd.to_datetime(frame['entered_at']) >= from_date).to_numpy()
+            if to_date is not None:
+                mask &= (pd.to_datetime(frame['entered_at']) <= to_date).to_numpy()
+            return frame[mask]
+
+        state = self.state
+        segments, current = scoped(state.segments), scoped(state.open)
+        hours = {status: group.to_numpy(dtype=float) for status, group in segments.groupby('status')['hours']}
+        reached = pd.concat([segments[['appeal_id', 'status']], current[['appeal_id', 'status']]]) \
+            .drop_duplicates().groupby('status').size()
+        now = current['status'].value_counts()
+
+        data = []
+        for status in STATES:
+            values = hours.get(status.value, np.empty(0))
+            data.append({
+                "status": status.value,
+                "reached": int(reached.get(status.value, 0)),
+                "current": int(now.get(status.value, 0)),
+                "completed": len(values),
+                "mean_hours": round(float(values.mean()), 1) if len(values) else None,
+                **percentiles(values),
+                "max_hours": round(float(values.max()), 1) if len(values) else None,
+            })
+        return data
+
+
+dwell_times = DwellTimes(
+    batch=int(os.getenv('DWELL_BATCH', 50000)),
+    rebuild_after=int(os.getenv('DWELL_REBUILD_SECONDS', 3600))
+)
@@ -1,14 +1,14 @@
 import os
+from contextlib import asynccontextmanager
 from fastapi import FastAPI, status, Depends, HTTPException, Request
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import ORJSONResponse
 from backend.schema import Settings
 from fastapi.encoders import jsonable_encoder
 from fastapi_jwt_auth import AuthJWT
-from backend.database import Session, ENGINE, connect
-from backend.model import User
+from backend.model import User, User_Status
 from fastapi.staticfiles import StaticFiles
 from logging.handlers import TimedRotatingFileHandler
-from fastapi_jwt_auth.exceptions import InvalidHeaderError, MissingTokenError, JWTDecodeError
 
 
 
@@ -19,17 +19,32 @@ from backend.routers.user import user_router
 from backend.routers.mekeme import mekeme_router
 from backend.routers.mahalla import mahalla_router
 from backend.routers.sector import sector_router
-from backend.routers.auth import auth_router
+from backend.routers.auth import auth_router, verify
 from backend.routers.tg_appeal import tg_appeal_router, tg_user_router
 from backend.routers.appeal import appeal_router
 from backend.routers.base_page import statistics_router
+from backend.routers.events import events_router
+from backend.routers.exports import exports_router
+from backend.views import view_buffer
+from backend.export_jobs import export_jobs
+from backend.workers import worker_pool
 
-session = Session(bind=ENGINE)
 
 
 
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    view_buffer.start()
+    worker_pool.start()
+    yield
+    await export_jobs.stop()
+    worker_pool.stop()
+    await view_buffer.stop()
+
 
 app = FastAPI(
+    lifespan=lifespan,
+    default_response_class=ORJSONResponse,
     # redoc_url=None,
     # docs_url=None,
     # debug=False,
@@ -55,6 +70,8 @@ app.include_router(tg_user_router)
 app.include_router(tg_appeal_router)
 app.include_router(appeal_router)
 app.include_router(statistics_router)
+app.include_router(events_router)
+app.include_router(exports_router)
 
 
 
@@ -70,12 +87,8 @@ app.add_middleware(
 
 
 @app.get('/me', status_code=status.HTTP_200_OK)
-async def user_me(session : Session = Depends(connect), Authorization: AuthJWT = Depends()):
+async def user_me(user : User = Depends(verify)):
     try:
-        Authorization.jwt_required()
-        login = Authorization.get_jwt_subject()
-
-        user = session.query(User).filter(User.login == login).first()
         if not user:
             raise HTTPException(status_code=status.HTTP_404_NOT_FOUND)
 
@@ -94,6 +107,13 @@ async def user_me(session : Session = Depends(connect), Authorization: AuthJWT =
     except Exception as e:
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED)
 
+@app.get('/workers', status_code=status.HTTP_200_OK)
+async def workers(user : User = Depends(verify)):
+    if user.role not in [User_Status.CEO, User_Status.ADMIN]:
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN)
+
+    return worker_pool.stats()
+
 app.mount("/appeal-files", StaticFiles(directory="appeal-files"), name="appeal-files")
 
 
@@ -123,28 +143,11 @@ async def log_requests(request: Request, call_next):
     if request.method == "OPTIONS":
         return await call_next(request)
 
-    auth_header = request.headers.get("Authorization")
-    user_id = "Anonymous"
-
-    try:
-        if auth_header and auth_header.startswith("Bearer "):
-            token = auth_header.split(" ")[1]
-            Authorize = AuthJWT()
-            decoded_token = Authorize.get_raw_jwt(token)
-            login = decoded_token.get("sub")
-
-            user = session.query(User).filter(User.login == login).first()
-            if user:
-                user_id = user.id
-
-    except (MissingTokenError, InvalidHeaderError, JWTDecodeError):
-        user_id = "Anonymous"
-    except Exception as e:
-        logger.error(f"Неожиданная ошибка при разборе токена: {e}")
-        user_id = "Anonymous"
-
     response = await call_next(request)
 
+    # set by verify() once the endpoint has resolved the token
+    user_id = getattr(request.state, "user_id", "Anonymous")
+
     try:
         logger.info(
             f"User ID: {user_id}, Method: {request.method}, URL: {request.url}, "
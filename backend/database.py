@@ -1,29 +1,53 @@
 import os
 from dotenv import load_dotenv
 from sqlalchemy import create_engine
+from sqlalchemy.engine import make_url
 from sqlalchemy.orm import sessionmaker, declarative_base
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker, AsyncSession
 
 load_dotenv()
 
 data = os.getenv('DATABASE')
 
+
+def async_url(url):
+    # postgresql://... -> postgresql+asyncpg://..., sqlite://... -> sqlite+aiosqlite://...
+    url = make_url(url)
+    if url.get_backend_name() == 'sqlite':
+        return url.set(drivername='sqlite+aiosqlite')
+    return url.set(drivername='postgresql+asyncpg')
+
+
+def pool_options(url):
+    if make_url(url).get_backend_name() == 'sqlite':
+        return {}
+
+    return dict(
+        pool_size=50,
+        max_overflow=100,
+        pool_timeout=30,
+        pool_recycle=1800,
+        pool_pre_ping=True
+    )
+
+
+# sync engine is kept for table creation and command line scripts
 ENGINE = create_engine(
     f'{data}',
-    pool_size=50,
-    max_overflow=100,
-    pool_timeout=30,
-    pool_recycle=1800,
-    pool_pre_ping=True
+    **pool_options(data)
+)
+
+ASYNC_ENGINE = create_async_engine(
+    async_url(data),
+    **pool_options(data)
 )
 
 Base = declarative_base()
 Session = sessionmaker(bind=ENGINE, autoflush=False)
+AsyncSessionLocal = async_sessionmaker(bind=ASYNC_ENGINE, autoflush=False, expire_on_commit=False)
 
 
 
-def connect():
-    session = Session()
-    try:
+async def connect():
+    async with AsyncSessionLocal() as session:
         yield session
-    finally:
-        session.close()
\ No newline at end of file
@@ -0,0 +1,141 @@
+import os
+import asyncio
+import logging
+import zipfile
+import aiofiles
+from sqlalchemy import select
+from sqlalchemy.orm import selectinload
+from backend.database import AsyncSessionLocal
+from backend.model import Appeal, AppealHistory, Mahalla
+from backend.export import ChunkSink, CHUNK_SIZE
+from backend.pdf_cache import appeal_pdf
+
+
+logger = logging.getLogger(__name__)
+
+
+# zip of appeal_<id>/ folders: the rendered pdf, the appeal attachment and every file referenced
+# from its history. the archive is written into a ChunkSink (zip data descriptors, no seeking) and
+# drained to the client after every chunk, so at most one chunk is buffered. the pdfs of a batch
+# are rendered concurrently in the worker pool (or come from the pdf cache)
+
+DOSSIER_BATCH = int(os.getenv('DOSSIER_BATCH', 20))
+
+HISTORY_FILES = ('time_file', 'report_appeal_user', 'report_government', 'report_photo')
+
+# already compressed formats are stored as they are, deflating them only costs cpu
+STORED_EXTENSIONS = {'.pdf', '.jpg', '.jpeg', '.png', '.zip', '.docx'}
+
+
+def upload_path(path, upload_dir):
+    # only regular files inside the upload directory, stored paths come from user input
+    if not path:
+        return None
+
+    root = os.path.realpath(upload_dir)
+    full = os.path.realpath(path.lstrip('/'))
+    if os.path.commonpath([full, root]) != root or not os.path.isfile(full):
+        return None
+    return full
+
+
+async def load_batch(session, ids):
+    appeals = (await session.scalars(
+        select(Appeal)
+        .options(selectinload(Appeal.mekeme), selectinload(Appeal.mahalla).selectinload(Mahalla.sector))
+        .where(Appeal.id.in_(ids))
+    )).all()
+
+    history = (await session.execute(
+        select(AppealHistory.appeal_id, AppealHistory.id, *(getattr(AppealHistory, name) for name in HISTORY_FILES))
+        .where(AppealHistory.appeal_id.in_(ids))
+        .order_by(AppealHistory.appeal_id, AppealHistory.id)
+    )).all()
+
+    files = {}
+    for appeal_id, history_id, *paths in history:
+        for name, path in zip(HISTORY_FILES, paths):
+            if path:
+                files.setdefault(appeal_id, []).append((f"history_{history_id}_{name}", path))
+
+    by_id = {appeal.id: appeal for appeal in appeals}
+    return [by_id[id] for id in ids if id in by_id], files
+
+
+async def write_file(archive, sink, name, path):
+    try:
+        size = os.stat(path).st_size
+        source = await aiofiles.open(path, 'rb')
+    except OSError as e:
+        logger.error(f"Dossier: {name} skipped: {e}")
+        return
+
+    info = name
+    if os.path.splitext(name)[1].lower() in STORED_EXTENSIONS:
+        info = zipfile.ZipInfo(name)
+        info.compress_type = zipfile.ZIP_STORED
+
+    try:
+        # the size is not known to open() in write mode, zip64 headers have to be asked for up front
+        with archive.open(info, 'w', force_zip64=size > zipfile.ZIP64_LIMIT) as entry:
+            while chunk := await source.read(CHUNK_SIZE):
+                entry.write(chunk)
+                data = sink.drain()
+                if data:
+                    yield data
+    finally:
+        await source.close()
+
+    data = sink.drain()
+    if data:
+        yield data
+
+
+async def dossier_stream(ids, document_of, upload_dir):
+    sink = ChunkSink()
+    archive = zipfile.ZipFile(sink, 'w', compression=zipfile.ZIP_DEFLATED, compresslevel=1)
+    pending = []
+    writer = None
+
+    try:
+        async with AsyncSessionLocal() as session:
+            for start in range(0, len(ids), DOSSIER_BATCH):
+                appeals, files = await load_batch(session, ids[start:start + DOSSIER_BATCH])
+                pending = [asyncio.create_task(appeal_pdf(document_of(appeal))) for appeal in appeals]
+
+                for appeal, task in zip(appeals, pending):
+                    folder = f"appeal_{appeal.id}"
+                    try:
+                        entries = [(f"appeal_{appeal.id}.pdf", await task)]
+                    except Exception as e:
+                        logger.error(f"Dossier: pdf of appeal {appeal.id} failed: {e}")
+                        entries = []
+
+                    seen = set()
+                    for name, path in [("attachment", appeal.file_path)] + files.get(appeal.id, []):
+                        full = upload_path(path, upload_dir)
+                        if full and full not in seen:
+                            seen.add(full)
+                            entries.append((f"{name}_{os.path.basename(full)}", full))
+
+                    for name, path in entries:
+                        writer = write_file(archive, sink, f"{folder}/{name}", path)
+                        async for data in writer:
+                            yield data
+                        writer = None
+
+        archive.close()
+        yield sink.drain()
+
+    finally:
+        for task in pending:
+            task.cancel()
+
+        # an aborted download leaves an entry open, it has to be closed (with its source file)
+        # before the archive
+        if writer is not None:
+            await writer.aclose()
+        try:
+            archive.close()
+        except Exception as e:
+            logger.error(f"Dossier: archive close failed: {e}")
@@ -0,0 +1,44 @@
+import hashlib
+from fastapi import Request, Response, status
+from sqlalchemy import select
+from backend.model import ChangeCounter
+
+
+# conditional GET: the ETag is a hash of the versions the payload depends on (Appeal.version,
+# change_counter rows), so a poll with a matching If-None-Match is answered with 304
+# after one small query, without loading or serializing the payload
+
+CACHE_CONTROL = 'private, no-cache'
+
+
+def counter(name):
+    return select(ChangeCounter.version).where(ChangeCounter.name == name).scalar_subquery()
+
+
+async def counters(session, *names):
+    return tuple((await session.execute(select(*(counter(name) for name in names)))).one())
+
+
+def make_etag(*parts):
+    return 'W/"%s"' % hashlib.blake2b(repr(parts).encode(), digest_size=12).hexdigest()
+
+
+def etag_matches(request: Request, etag):
+    header = request.headers.get('if-none-match')
+    if not header:
+        return False
+    if header.strip() == '*':
+        return True
+
+    # weak comparison, W/"x" and "x" are the same tag
+    return etag.removeprefix('W/') in {tag.strip().removeprefix('W/') for tag in header.split(',')}
+
+
+def set_etag(response: Response, etag):
+    response.headers['ETag'] = etag
+    response.headers['Cache-Control'] = CACHE_CONTROL
+    return response
+
+
+def not_modified(etag):
+    return set_etag(Response(status_code=status.HTTP_304_NOT_MODIFIED), etag)
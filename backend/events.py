@@ -0,0 +1,193 @@
+import os
+import asyncio
+from collections import Counter
+from datetime import date, timedelta
+from sqlalchemy import event, inspect
+from sqlalchemy.orm import Session as OrmSession
+from backend.model import Appeal, Appeal_Status, TgUserAppeal, User_Status
+
+
+# push feed for dashboards (GET /events). flush listeners collect appeal / tg appeal changes from
+# every ORM write, after_commit hands them to the subscribers of this process; each connection
+# turns them into /statistics counter deltas and "new appeal" alerts for its own role and mekeme.
+# subscribers are in-process, one uvicorn worker sees the writes made by that worker only.
+
+QUEUE_SIZE = int(os.getenv('EVENTS_QUEUE_SIZE', 100))
+
+STATUS_COUNTERS = {
+    Appeal_Status.SUCCESS_DONE: 'done_appeals',
+    Appeal_Status.TEXT_DONE: 'done_appeals',
+    Appeal_Status.WAITING: 'waiting_appeals',
+    Appeal_Status.REJECTED: 'rejected_appeals',
+    Appeal_Status.TIME_REQUEST: 'time_requests',
+    Appeal_Status.ARCHIVE: 'archive_appeals',
+    Appeal_Status.CONFIRM: 'confirm_appeals',
+    Appeal_Status.CONFIRM_50: 'confirm_appeals',
+}
+
+RESYNC = 'resync'
+
+
+class Subscription:
+
+    def __init__(self, user, maxsize):
+        self.user = user
+        self.queue = asyncio.Queue(maxsize=maxsize)
+
+    def push(self, events):
+        # a client that stopped reading gets one resync instead of an unbounded backlog
+        if self.queue.full():
+            while not self.queue.empty():
+                self.queue.get_nowait()
+            self.queue.put_nowait(RESYNC)
+            return
+        self.queue.put_nowait(events)
+
+
+class EventBus:
+
+    def __init__(self, maxsize=100):
+        self.maxsize = maxsize
+        self._subscriptions = set()
+
+    def subscribe(self, user):
+        subscription = Subscription(user, self.maxsize)
+        self._subscriptions.add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        self._subscriptions.discard(subscription)
+
+    def publish(self, events):
+        for subscription in list(self._subscriptions):
+            subscription.push(events)
+
+    def __len__(self):
+        return len(self._subscriptions)
+
+
+event_bus = EventBus(maxsize=QUEUE_SIZE)
+
+
+def previous(obj, name):
+    return (inspect(obj).attrs[name].history.deleted or [getattr(obj, name)])[0]
+
+
+@event.listens_for(OrmSession, 'after_flush')
+def collect_events(session, flush_context):
+    pending = session.info.setdefault('events', [])
+
+    for obj in session.new:
+        if isinstance(obj, Appeal):
+            pending.append({
+                "type": "appeal_created", "id": obj.id, "mekeme_id": obj.mekeme_id,
+                "status": obj.appeal_status, "created_at": obj.created_at,
+            })
+        elif isinstance(obj, TgUserAppeal):
+            pending.append({"type": "tg_appeal_created", "id": obj.id})
+
+    for obj in session.dirty:
+        if not isinstance(obj, Appeal):
+            continue
+
+        old_mekeme_id, old_status = previous(obj, 'mekeme_id'), previous(obj, 'appeal_status')
+        if (old_mekeme_id, old_status) == (obj.mekeme_id, obj.appeal_status):
+            continue
+
+        pending.append({
+            "type": "appeal_changed", "id": obj.id, "created_at": obj.created_at,
+            "old_mekeme_id": old_mekeme_id, "mekeme_id": obj.mekeme_id,
+            "old_status": old_status, "status": obj.appeal_status,
+        })
+
+    for obj in session.deleted:
+        if isinstance(obj, Appeal):
+            pending.append({
+                "type": "appeal_deleted", "id": obj.id, "mekeme_id": previous(obj, 'mekeme_id'),
+                "status": previous(obj, 'appeal_status'), "created_at": obj.created_at,
+            })
+
+
+@event.listens_for(OrmSession, 'after_commit')
+def publish_events(session):
+    events = session.info.pop('events', None)
+    if events and len(event_bus):
+        event_bus.publish(events)
+
+
+@event.listens_for(OrmSession, 'after_rollback')
+def discard_events(session):
+    session.info.pop('events', None)
+
+
+def appeal_counters(status, created_at, sign):
+    # the /statistics keys one appeal contributes to
+    counters = Counter(all_appeals=sign)
+
+    key = STATUS_COUNTERS.get(status)
+    if key:
+        counters[key] += sign
+
+    today = date.today()
+    day = created_at.date() if created_at else today
+    if day == today:
+        counters['today_appeals'] += sign
+    if day == today - timedelta(days=1):
+        counters['yesterday_appeals'] += sign
+    if day.year == today.year:
+        counters['year_appeals'] += sign
+        if day.month == today.month:
+            counters['month_appeals'] += sign
+
+    return counters
+
+
+def messages(user, events):
+    # (event name, payload) pairs this user may see, counter deltas merged into one message
+    admin = user.role in [User_Status.CEO, User_Status.ADMIN]
+
+    def visible(mekeme_id):
+        return admin or (mekeme_id is not None and mekeme_id == user.mekeme_id)
+
+    counters = Counter()
+    result = []
+
+    for item in events:
+        kind = item["type"]
+
+        if kind == 'tg_appeal_created':
+            if admin:
+                counters['tg_appeals'] += 1
+                result.append(('tg_appeal', {"id": item["id"], "event": "created"}))
+            continue
+
+        if kind == 'appeal_created':
+            if visible(item["mekeme_id"]):
+                counters.update(appeal_counters(item["status"], item["created_at"], 1))
+                result.append(('appeal', {
+                    "id": item["id"], "event": "created",
+                    "mekeme_id": item["mekeme_id"], "status": item["status"],
+                }))
+            continue
+
+        if kind == 'appeal_deleted':
+            if visible(item["mekeme_id"]):
+                counters.update(appeal_counters(item["status"], item["created_at"], -1))
+            continue
+
+        if visible(item["old_mekeme_id"]):
+            counters.update(appeal_counters(item["old_status"], item["created_at"], -1))
+        if visible(item["mekeme_id"]):
+            counters.update(appeal_counters(item["status"], item["created_at"], 1))
+
+            assigned = item["mekeme_id"] != item["old_mekeme_id"]
+            result.append(('appeal', {
+                "id": item["id"], "event": "assigned" if assigned else "status",
+                "mekeme_id": item["mekeme_id"], "status": item["status"], "old_status": item["old_status"],
+            }))
+
+    counters = {key: value for key, value in counters.items() if value}
+    if counters:
+        result.insert(0, ('counters', counters))
+
+    return result
@@ -0,0 +1,268 @@
+import io
+import os
+import csv
+import asyncio
+import tempfile
+from enum import Enum
+from datetime import date, datetime
+from sqlalchemy import select
+from fastapi.responses import StreamingResponse
+from openpyxl import Workbook
+from openpyxl.cell import WriteOnlyCell
+from openpyxl.styles import Alignment
+from openpyxl.utils import get_column_letter
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = pq = None
+from fastapi import HTTPException
+from backend.database import AsyncSessionLocal
+from backend.model import Appeal, Appeal_Status, Gender, Mahalla, Sector, Mekeme, TgUserAppeal
+
+
+# exports read one flat projection through a server-side cursor, EXPORT_BATCH rows at a time,
+# and never hold more than one batch in memory. they open their own session because the
+# response body is produced after the endpoint (and its request session) has returned.
+# xlsx carries the display formatting, csv / parquet carry plain values for analysis
+
+EXPORT_BATCH = int(os.getenv('EXPORT_BATCH', 1000))
+CHUNK_SIZE = 64 * 1024
+
+XLSX_MEDIA_TYPE = 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+
+# the workbook is filled batch by batch while rows stream from the cursor, its state cannot be
+# handed to the worker pool, so the builds run in threads and at most XLSX_BUILDS at a time
+xlsx_builds = asyncio.Semaphore(int(os.getenv('XLSX_BUILDS', 2)))
+
+
+def date_format(fmt):
+    return lambda value: value.strftime(fmt) if value else None
+
+
+def enum_value(value):
+    return value.value if value else None
+
+
+def plain(value):
+    return value.value if isinstance(value, Enum) else value
+
+
+def gender_name(value):
+    if value is None:
+        return None
+    return 'erkek' if value == Gender.MALE else 'ayel'
+
+
+# (header, xlsx column width, projection column, formatter)
+APPEAL_COLUMNS = [
+    ("ID", 8, Appeal.id, None),
+    ("ФИО", 30, Appeal.fio, None),
+    ("Пол", 8, Appeal.gender, gender_name),
+    ("Телефон номер", 16, Appeal.phone, None),
+    ("Серия документа", 10, Appeal.doc_series, None),
+    ("Документ №", 14, Appeal.doc_num, None),
+    ("Махалля", 24, Mahalla.name.label('mahalla'), None),
+    ("Адрес", 40, Appeal.address, None),
+    ("Дата рождения", 14, Appeal.birthday, date_format('%d.%m.%Y')),
+    ("Создано", 18, Appeal.created_at, date_format('%H:%M %d.%m.%Y')),
+    ("Статус", 14, Appeal.appeal_status, enum_value),
+    ("сектор", 24, Sector.name.label('sector'), None),
+    ("Организация (куда отправлено обращение гражданина)", 40, Mekeme.name.label('mekeme'), None),
+]
+
+TG_APPEAL_COLUMNS = [
+    ("ID", 8, TgUserAppeal.id, None),
+    ("Telegram ID", 14, TgUserAppeal.tg_user_id, None),
+    ("ФИО", 30, TgUserAppeal.fio, None),
+    ("Телефон номер", 16, TgUserAppeal.phone, None),
+    ("Документ", 16, TgUserAppeal.document, None),
+    ("Дата рождения", 14, TgUserAppeal.birthday, None),
+    ("Махалля", 24, TgUserAppeal.mahalla, None),
+    ("Адрес", 40, TgUserAppeal.address, None),
+    ("Текст", 60, TgUserAppeal.text, None),
+    ("Статус", 14, TgUserAppeal.tg_appeal_status, enum_value),
+    ("Создано", 18, TgUserAppeal.created_at, date_format('%H:%M %d.%m.%Y')),
+]
+
+# long free text, aligned to the top left instead of centered
+LEFT_ALIGNED = {"Адрес", "Текст"}
+
+
+def appeal_export_query(scope_mekeme_id=None, mekeme_id=None, from_date=None, to_date=None, status=None):
+    query = (
+        select(*(column for _, _, column, _ in APPEAL_COLUMNS))
+        .select_from(Appeal)
+        .outerjoin(Mahalla, Mahalla.id == Appeal.mahalla_id)
+        .outerjoin(Sector, Sector.id == Mahalla.sector_id)
+        .outerjoin(Mekeme, Mekeme.id == Appeal.mekeme_id)
+    )
+
+    if scope_mekeme_id is not None:
+        query = query.where(Appeal.mekeme_id == scope_mekeme_id)
+    if mekeme_id:
+        query = query.where(Appeal.mekeme_id == mekeme_id)
+    if from_date:
+        query = query.where(Appeal.created_at >= from_date)
+    if to_date:
+        query = query.where(Appeal.created_at <= to_date)
+    if status:
+        if status == 'done':
+            query = query.where(Appeal.appeal_status.in_([Appeal_Status.SUCCESS_DONE, Appeal_Status.TEXT_DONE]))
+        else:
+            query = query.where(Appeal.appeal_status == status.upper())
+
+    return query.order_by(Appeal.id.desc())
+
+
+def tg_appeal_export_query(status=None, from_date=None, to_date=None):
+    query = select(*(column for _, _, column, _ in TG_APPEAL_COLUMNS))
+
+    if status:
+        query = query.where(TgUserAppeal.tg_appeal_status == status)
+    if from_date:
+        query = query.where(TgUserAppeal.created_at >= from_date)
+    if to_date:
+        query = query.where(TgUserAppeal.created_at <= to_date)
+
+    return query.order_by(TgUserAppeal.id.desc())
+
+
+async def has_rows(session, query):
+    return await session.scalar(select(query.order_by(None).limit(1).exists())) or False
+
+
+async def export_batches(query, columns, formatted=True):
+    formatters = [formatter if formatted else plain for _, _, _, formatter in columns]
+
+    async with AsyncSessionLocal() as session:
+        result = await session.stream(query.execution_options(yield_per=EXPORT_BATCH))
+        async for partition in result.partitions():
+            yield [
+                [formatter(value) if formatter else value for formatter, value in zip(formatters, row)]
+                for row in partition
+            ]
+
+
+def xlsx_sheet(workbook, title, columns):
+    sheet = workbook.create_sheet(title)
+    for index, (_, width, _, _) in enumerate(columns, start=1):
+        sheet.column_dimensions[get_column_letter(index)].width = width
+    return sheet
+
+
+def xlsx_append(sheet, columns, rows):
+    center = Alignment(wrap_text=True, vertical='center', horizontal='center')
+    left = Alignment(wrap_text=True, vertical='top', horizontal='left')
+    alignments = [left if header in LEFT_ALIGNED else center for header, _, _, _ in columns]
+
+    for row in rows:
+        cells = []
+        for alignment, value in zip(alignments, row):
+            cell = WriteOnlyCell(sheet, value=value)
+            cell.alignment = alignment
+            cells.append(cell)
+        sheet.append(cells)
+
+
+async def xlsx_stream(query, columns, title='Appeals'):
+    # write-only workbook: rows go straight to a temporary xml part on disk, save() zips the parts
+    # into a temporary file which is then sent in chunks
+    with tempfile.TemporaryFile() as output:
+        async with xlsx_builds:
+            workbook = Workbook(write_only=True)
+            sheet = xlsx_sheet(workbook, title, columns)
+            xlsx_append(sheet, columns, [[header for header, _, _, _ in columns]])
+
+            async for rows in export_batches(query, columns):
+                await asyncio.to_thread(xlsx_append, sheet, columns, rows)
+
+            await asyncio.to_thread(workbook.save, output)
+
+        output.seek(0)
+
+        while chunk := await asyncio.to_thread(output.read, CHUNK_SIZE):
+            yield chunk
+
+
+async def csv_stream(query, columns):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow([header for header, _, _, _ in columns])
+
+    async for rows in export_batches(query, columns, formatted=False):
+        writer.writerows(rows)
+        yield buffer.getvalue().encode('utf-8')
+        buffer.seek(0)
+        buffer.truncate()
+
+    if buffer.tell():
+        yield buffer.getvalue().encode('utf-8')
+
+
+class ChunkSink(io.RawIOBase):
+    # write-only file for pyarrow / zipfile, whatever was written since the last drain() is sent to the client
+
+    def __init__(self):
+        self.chunks = []
+        self.position = 0
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self.chunks.append(bytes(data))
+        self.position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self.position
+
+    def drain(self):
+        data, self.chunks = b''.join(self.chunks), []
+        return data
+
+
+def arrow_schema(columns):
+    types = {bool: pa.bool_(), int: pa.int64(), float: pa.float64(), datetime: pa.timestamp('us'), date: pa.date32()}
+    return pa.schema([(header, types.get(column.type.python_type, pa.string())) for header, _, column, _ in columns])
+
+
+async def parquet_stream(query, columns):
+    # one row group per batch, the footer is written by close()
+    schema = arrow_schema(columns)
+    sink = ChunkSink()
+    writer = pq.ParquetWriter(sink, schema, compression='snappy')
+
+    try:
+        async for rows in export_batches(query, columns, formatted=False):
+            table = pa.Table.from_arrays(
+                [pa.array(values, type=field.type) for field, values in zip(schema, zip(*rows))],
+                schema=schema
+            )
+            await asyncio.to_thread(writer.write_table, table)
+            yield sink.drain()
+    finally:
+        writer.close()
+
+    yield sink.drain()
+
+
+EXPORT_FORMATS = {
+    "xlsx": (xlsx_stream, XLSX_MEDIA_TYPE),
+    "csv": (csv_stream, 'text/csv; charset=utf-8'),
+    "parquet": (parquet_stream, 'application/vnd.apache.parquet'),
+}
+
+
+def export_response(query, columns, format, filename):
+    if format == 'parquet' and pq is None:
+        raise HTTPException(status_code=400, detail="Parquet export requires pyarrow")
+
+    stream, media_type = EXPORT_FORMATS[format]
+    return StreamingResponse(
+        stream(query, columns),
+        media_type=media_type,
+        headers={'Content-Disposition': f'attachment; filename="{filename}.{format}"'}
+    )
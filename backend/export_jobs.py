@@ -0,0 +1,178 @@
+import os
+import time
+import uuid
+import asyncio
+import hashlib
+import logging
+import aiofiles
+from datetime import datetime
+from sqlalchemy import func
+from backend.model import Appeal, TgUserAppeal
+from backend.etag import counters
+from backend.export import EXPORT_FORMATS
+
+
+logger = logging.getLogger(__name__)
+
+
+# exports generated off the request path. an artifact is stored as <EXPORT_DIR>/<key>.<format>,
+# key = hash of (kind, filters, scope, data fingerprint). the fingerprint changes with every
+# relevant write, so an identical request made since the last change finds the file already there
+# (also across restarts) and concurrent identical requests share one running job.
+# files and finished jobs are dropped after EXPORT_TTL seconds
+
+PENDING, RUNNING, DONE, FAILED = 'pending', 'running', 'done', 'failed'
+
+
+async def appeal_fingerprint(session, query):
+    # any update bumps appeal.version, inserts / deletes move count and max(id);
+    # mahalla / sector / mekeme names are part of the export too
+    row = (await session.execute(
+        query.with_only_columns(func.count(Appeal.id), func.coalesce(func.sum(Appeal.version), 0), func.max(Appeal.id))
+        .order_by(None)
+    )).one()
+    return tuple(row) + await counters(session, 'mahalla', 'sector', 'mekeme')
+
+
+async def tg_appeal_fingerprint(session, query):
+    # tg appeals are not versioned, a status change moves the per-status counts
+    rows = (await session.execute(
+        query.with_only_columns(TgUserAppeal.tg_appeal_status, func.count(TgUserAppeal.id), func.max(TgUserAppeal.id))
+        .group_by(TgUserAppeal.tg_appeal_status)
+        .order_by(None)
+    )).all()
+    return tuple(sorted((status.value, count, max_id) for status, count, max_id in rows))
+
+
+def export_key(*parts):
+    return hashlib.blake2b(repr(parts).encode(), digest_size=16).hexdigest()
+
+
+class ExportJob:
+
+    def __init__(self, scope, path, format, filename):
+        self.id = uuid.uuid4().hex
+        self.scope = scope
+        self.path = path
+        self.format = format
+        self.filename = filename
+        self.status = PENDING
+        self.error = None
+        self.created_at = datetime.now()
+        self.finished_at = None
+
+    def finish(self, status, error=None):
+        self.status = status
+        self.error = error
+        self.finished_at = datetime.now()
+
+    def as_dict(self):
+        done = self.status == DONE
+        return {
+            "id": self.id,
+            "status": self.status,
+            "format": self.format,
+            "created_at": self.created_at,
+            "finished_at": self.finished_at,
+            "size": os.path.getsize(self.path) if done and os.path.exists(self.path) else None,
+            "error": self.error,
+            "download": f"/exports/{self.id}/download" if done else None,
+        }
+
+
+class ExportJobs:
+
+    def __init__(self, directory='exports', ttl=3600, workers=2):
+        self.directory = directory
+        self.ttl = ttl
+        self._semaphore = asyncio.Semaphore(workers)
+        self._jobs = {}
+        self._by_path = {}
+        self._tasks = set()
+
+    def get(self, id):
+        job = self._jobs.get(id)
+        if job is not None and job.status == DONE and not self.fresh(job.path):
+            self._drop(job)
+            return None
+        return job
+
+    def fresh(self, path):
+        try:
+            return os.path.getmtime(path) + self.ttl > time.time()
+        except OSError:
+            return False
+
+    def submit(self, key, scope, query, columns, format, filename):
+        self.purge()
+        os.makedirs(self.directory, exist_ok=True)
+        path = os.path.join(self.directory, f"{key}.{format}")
+
+        job = self._jobs.get(self._by_path.get(path))
+        if job is not None and (job.status in (PENDING, RUNNING) or (job.status == DONE and self.fresh(path))):
+            return job
+
+        job = ExportJob(scope, path, format, filename)
+        self._jobs[job.id] = job
+        self._by_path[path] = job.id
+
+        if self.fresh(path):
+            job.finish(DONE)
+            return job
+
+        task = asyncio.create_task(self._run(job, query, columns))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        return job
+
+    async def _run(self, job, query, columns):
+        stream, _ = EXPORT_FORMATS[job.format]
+        part = f"{job.path}.{job.id}.part"
+
+        async with self._semaphore:
+            job.status = RUNNING
+            try:
+                async with aiofiles.open(part, 'wb') as output:
+                    async for chunk in stream(query, columns):
+                        await output.write(chunk)
+                os.replace(part, job.path)
+                job.finish(DONE)
+
+            except Exception as e:
+                logger.error(f"Export {job.id} failed: {e}")
+                job.finish(FAILED, str(e))
+
+            finally:
+                if os.path.exists(part):
+                    os.remove(part)
+
+    def _drop(self, job):
+        self._jobs.pop(job.id, None)
+        if self._by_path.get(job.path) == job.id:
+            del self._by_path[job.path]
+
+    def purge(self):
+        expired = time.time() - self.ttl
+
+        for job in list(self._jobs.values()):
+            if job.finished_at is not None and job.finished_at.timestamp() < expired:
+                self._drop(job)
+
+        if not os.path.isdir(self.directory):
+            return
+
+        for entry in os.scandir(self.directory):
+            if entry.is_file() and entry.stat().st_mtime < expired:
+                os.remove(entry.path)
+
+    async def stop(self):
+        for task in list(self._tasks):
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+
+
+export_jobs = ExportJobs(
+    directory=os.getenv('EXPORT_DIR', 'exports'),
+    ttl=int(os.getenv('EXPORT_TTL', 3600)),
+    workers=int(os.getenv('EXPORT_WORKERS', 2))
+)
@@ -0,0 +1,74 @@
+import pkgutil
+import importlib
+from sqlalchemy import MetaData, Table, Column, Integer, String, DateTime, func, select, text, inspect
+from sqlalchemy.schema import CreateColumn
+from backend.database import Base, ENGINE
+
+
+# versioned schema changes: one module per version in backend/migrations/versions, named v<NNNN>_<name>.py,
+# each with upgrade(connection). applied versions are stored in schema_version.
+# v0001 builds a fresh database from the current models, so later versions must be safe to re-run
+# (checkfirst / IF NOT EXISTS) on a schema that already has their changes.
+
+metadata = MetaData()
+
+schema_version = Table(
+    'schema_version', metadata,
+    Column('version', Integer, primary_key=True),
+    Column('name', String, nullable=False),
+    Column('applied_at', DateTime, server_default=func.now()),
+)
+
+
+def migrations():
+    from backend.migrations import versions
+
+    found = []
+    for module in pkgutil.iter_modules(versions.__path__):
+        version, _, name = module.name[1:].partition('_')
+        found.append((int(version), name, importlib.import_module(f'{versions.__name__}.{module.name}')))
+    return sorted(found, key=lambda migration: migration[0])
+
+
+def applied(engine=ENGINE):
+    schema_version.create(engine, checkfirst=True)
+    with engine.connect() as connection:
+        return set(connection.scalars(select(schema_version.c.version)))
+
+
+def upgrade(engine=ENGINE, target=None):
+    done = applied(engine)
+    upgraded = []
+
+    for version, name, module in migrations():
+        if version in done or (target is not None and version > target):
+            continue
+
+        with engine.begin() as connection:
+            if connection.dialect.name == 'postgresql':
+                # one migrator at a time when several app containers start together
+                connection.execute(text('SELECT pg_advisory_xact_lock(:key)'), {"key": 20240601})
+                if connection.scalar(select(schema_version.c.version).where(schema_version.c.version == version)):
+                    continue
+
+            module.upgrade(connection)
+            connection.execute(schema_version.insert().values(version=version, name=name))
+
+        upgraded.append((version, name))
+
+    return upgraded
+
+
+def create_indexes(connection, *names):
+    indexes = {index.name: index for table in Base.metadata.tables.values() for index in table.indexes}
+    for name in names:
+        indexes[name].create(connection, checkfirst=True)
+
+
+def add_column(connection, column):
+    table = column.table
+    if column.name in {existing['name'] for existing in inspect(connection).get_columns(table.name)}:
+        return
+
+    name = connection.dialect.identifier_preparer.format_table(table)
+    connection.execute(text(f'ALTER TABLE {name} ADD COLUMN {CreateColumn(column).compile(dialect=connection.dialect)}'))
@@ -0,0 +1,36 @@
+import argparse
+from backend.migrations import upgrade, applied, migrations
+from backend.migrations.explain import explain
+
+
+parser = argparse.ArgumentParser(prog='python -m backend.migrations')
+commands = parser.add_subparsers(dest='command', required=True)
+
+upgrade_parser = commands.add_parser('upgrade', help='apply pending migrations')
+upgrade_parser.add_argument('--to', type=int, default=None, help='stop after this version')
+
+commands.add_parser('status', help='list migrations and whether they are applied')
+
+explain_parser = commands.add_parser('explain', help='print query plans for the hot queries')
+explain_parser.add_argument('--analyze', action='store_true', help='postgres: run the queries (EXPLAIN ANALYZE)')
+
+args = parser.parse_args()
+
+if args.command == 'upgrade':
+    upgraded = upgrade(target=args.to)
+    for version, name in upgraded:
+        print(f'applied {version:04d} {name}')
+    if not upgraded:
+        print('up to date')
+
+elif args.command == 'status':
+    done = applied()
+    for version, name, _ in migrations():
+        print(f"{'x' if version in done else ' '} {version:04d} {name}")
+
+elif args.command == 'explain':
+    for name, plan in explain(analyze=args.analyze).items():
+        print(f'-- {name}')
+        for line in plan:
+            print(f'   {line}')
+        print()
@@ -0,0 +1,57 @@
+from types import SimpleNamespace
+from datetime import datetime, timedelta
+from sqlalchemy import select, func, text
+from backend.database import ENGINE
+from backend.model import Appeal, Appeal_Status, AppealView, AppealHistory, AppealAnswer, TgUserAppeal, Mahalla, User_Status, appeal_open
+from backend.search import search_filter
+from backend.routers.base_page import statistics_query, count_if
+
+
+# the query shapes behind the dashboard endpoints, with representative parameters
+
+def hot_queries(dialect, mekeme_id=1, appeal_id=1, user_id=1, tg_user_id=1, limit=10):
+    today = datetime.now().replace(hour=0, minute=0, second=0, microsecond=0)
+    listing = select(Appeal.id, Appeal.fio, Appeal.appeal_status, Appeal.created_at, Mahalla.name) \
+        .outerjoin(Mahalla, Appeal.mahalla_id == Mahalla.id)
+    count = select(func.count(Appeal.id))
+
+    return {
+        'get_appeals admin': listing.order_by(Appeal.id.desc()).limit(limit),
+        'get_appeals admin status': listing.where(Appeal.appeal_status == Appeal_Status.WAITING)
+            .order_by(Appeal.id.desc()).limit(limit),
+        'get_appeals mekeme': listing.where(Appeal.mekeme_id == mekeme_id).order_by(Appeal.id.desc()).limit(limit),
+        'get_appeals mekeme status': listing.where(Appeal.mekeme_id == mekeme_id, Appeal.appeal_status == Appeal_Status.WAITING)
+            .order_by(Appeal.id.desc()).limit(limit),
+        'get_appeals mekeme after cursor': listing.where(Appeal.mekeme_id == mekeme_id, Appeal.id < 1000)
+            .order_by(Appeal.id.desc()).limit(limit),
+        'get_appeals mekeme date total': count.where(Appeal.mekeme_id == mekeme_id, Appeal.created_at >= today - timedelta(days=30)),
+        'get_appeals search': listing.where(search_filter(Appeal, 'test', dialect)).order_by(Appeal.id.desc()).limit(limit),
+        'statistics admin': statistics_query(SimpleNamespace(role=User_Status.ADMIN, mekeme_id=None)),
+        'statistics mekeme': statistics_query(SimpleNamespace(role=User_Status.USER, mekeme_id=mekeme_id)),
+        'statistics sla open': select(Appeal.mekeme_id, func.count(Appeal.id), count_if(Appeal.deadline < today))
+            .where(appeal_open).group_by(Appeal.mekeme_id),
+        'get_appeal': select(Appeal).where(Appeal.id == appeal_id),
+        'get_appeal view check': select(AppealView).where(AppealView.appeal_id == appeal_id, AppealView.user_id == user_id),
+        'get_appeal by tg appeal': select(Appeal).where(Appeal.tg_appeal_id == appeal_id),
+        'history': select(AppealHistory).where(AppealHistory.appeal_id == appeal_id).order_by(AppealHistory.id.desc()),
+        'last answer': select(AppealAnswer).where(AppealAnswer.appeal_id == appeal_id)
+            .order_by(AppealAnswer.created_at.desc()).limit(1),
+        'tg user appeals': select(TgUserAppeal).where(TgUserAppeal.tg_user_id == tg_user_id).order_by(TgUserAppeal.id.desc()),
+    }
+
+
+def explain(engine=ENGINE, analyze=False):
+    dialect = engine.dialect.name
+    if dialect == 'postgresql':
+        prefix = 'EXPLAIN (ANALYZE, BUFFERS)' if analyze else 'EXPLAIN'
+    else:
+        prefix = 'EXPLAIN QUERY PLAN'
+
+    plans = {}
+    with engine.connect() as connection:
+        for name, query in hot_queries(dialect).items():
+            sql = query.compile(dialect=engine.dialect, compile_kwargs={"literal_binds": True})
+            rows = connection.execute(text(f'{prefix} {sql}'.replace(':', r'\:'))).all()
+            plans[name] = [row[-1] for row in rows]
+
+    return plans
@@ -0,0 +1,7 @@
+from backend.database import Base
+import backend.model  # noqa: F401  registers the tables
+
+
+# what table.py used to do
+def upgrade(connection):
+    Base.metadata.create_all(connection)
@@ -0,0 +1,14 @@
+from sqlalchemy import text
+from backend.migrations import create_indexes
+
+
+def upgrade(connection):
+    if connection.dialect.name != 'postgresql':
+        return
+
+    connection.execute(text('CREATE EXTENSION IF NOT EXISTS pg_trgm'))
+    create_indexes(
+        connection,
+        'ix_appeal_search_vector', 'ix_appeal_search_trgm',
+        'ix_tg_appeal_search_vector', 'ix_tg_appeal_search_trgm',
+    )
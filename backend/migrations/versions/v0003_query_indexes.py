@@ -0,0 +1,22 @@
+from backend.migrations import create_indexes
+
+
+def upgrade(connection):
+    create_indexes(
+        connection,
+        'ix_user_mekeme_id',
+        'ix_hakimiyat_appeal_appeal_id',
+        'ix_appeal_mekeme_id_id',
+        'ix_appeal_mekeme_id_status_id',
+        'ix_appeal_status_id',
+        'ix_appeal_created_at',
+        'ix_appeal_mekeme_id_created_at',
+        'ix_appeal_tg_appeal_id',
+        'ix_appeal_open_deadline',
+        'ix_appeal_view_appeal_id_user_id',
+        'ix_appeal_history_appeal_id_id',
+        'ix_mekeme_appeal_appeal_id_created_at',
+        'ix_tg_appeal_tg_user_id_id',
+        'ix_tg_appeal_status_id',
+        'ix_tg_appeal_history_tg_appeal_id_id',
+    )
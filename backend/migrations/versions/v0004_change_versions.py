@@ -0,0 +1,15 @@
+from sqlalchemy import select
+from backend.migrations import add_column
+from backend.model import Appeal, ChangeCounter, COUNTED_TABLES
+
+
+def upgrade(connection):
+    add_column(connection, Appeal.__table__.c.version)
+
+    counter = ChangeCounter.__table__
+    counter.create(connection, checkfirst=True)
+
+    existing = set(connection.scalars(select(counter.c.name)))
+    missing = [{"name": name, "version": 0} for name in COUNTED_TABLES if name not in existing]
+    if missing:
+        connection.execute(counter.insert(), missing)
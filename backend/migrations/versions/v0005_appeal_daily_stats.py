@@ -0,0 +1,7 @@
+from backend.model import AppealDailyStats
+from backend.rollup import backfill
+
+
+def upgrade(connection):
+    AppealDailyStats.__table__.create(connection, checkfirst=True)
+    backfill(connection)
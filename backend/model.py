@@ -1,7 +1,9 @@
 from backend.database import Base
-from sqlalchemy import Column, Integer, String, ForeignKey, Enum as SQLAEnum, DateTime, func, BIGINT, Boolean
-from sqlalchemy.orm import relationship
+from sqlalchemy import Column, Integer, String, ForeignKey, Enum as SQLAEnum, DateTime, Date, func, BIGINT, Boolean, Index, DDL, event, text, inspect
+from sqlalchemy.orm import relationship, object_session, Session as OrmSession
+from sqlalchemy.dialects import postgresql, sqlite  # postgresql also registers func.to_tsvector / plainto_tsquery
 from enum import Enum
+from itertools import chain
 
 
 class Appeal_Status(Enum):
@@ -21,6 +23,10 @@ class Appeal_Status(Enum):
     ARCHIVE = "archive"                  # APPEAL ARXIV
 
 
+# appeals still waiting on a mekeme or hakimiyat, a small slice of the table
+appeal_open = text("appeal_status NOT IN ('SUCCESS_DONE', 'TEXT_DONE', 'ARCHIVE')")
+
+
 
 
 
@@ -65,6 +71,9 @@ class Mekeme(Base):
 
 class User(Base):
     __tablename__ = 'user'
+    __table_args__ = (
+        Index('ix_user_mekeme_id', 'mekeme_id'),
+    )
     id = Column(Integer, primary_key=True, index=True, autoincrement=True)
     fio = Column(String, nullable=False)
     login = Column(String, unique=True, nullable=False)
@@ -84,6 +93,9 @@ class User(Base):
 
 class AppealHakimiyat(Base):
     __tablename__ = 'hakimiyat_appeal'
+    __table_args__ = (
+        Index('ix_hakimiyat_appeal_appeal_id', 'appeal_id'),
+    )
 
     id = Column(Integer, primary_key=True, index=True, autoincrement=True)
     text = Column(String)
@@ -96,6 +108,21 @@ class AppealHakimiyat(Base):
 
 class Appeal(Base):
     __tablename__ = 'appeal'
+    __table_args__ = (
+        # listings: WHERE mekeme_id [AND appeal_status] ORDER BY id DESC, keyset on id
+        Index('ix_appeal_mekeme_id_id', 'mekeme_id', 'id'),
+        Index('ix_appeal_mekeme_id_status_id', 'mekeme_id', 'appeal_status', 'id'),
+        Index('ix_appeal_status_id', 'appeal_status', 'id'),
+        # statistics and date filters
+        Index('ix_appeal_created_at', 'created_at'),
+        Index('ix_appeal_mekeme_id_created_at', 'mekeme_id', 'created_at'),
+        Index('ix_appeal_tg_appeal_id', 'tg_appeal_id'),
+        # open appeals by deadline, queries must filter with the same appeal_open clause
+        Index('ix_appeal_open_deadline', 'mekeme_id', 'deadline',
+              postgresql_where=appeal_open, sqlite_where=appeal_open),
+    )
+    # created_at and version come back with the INSERT/UPDATE (RETURNING), flush listeners read them
+    __mapper_args__ = {'eager_defaults': True}
 
     id = Column(Integer, primary_key=True, index=True, autoincrement=True)
     fio = Column(String, nullable=False)
@@ -114,6 +141,7 @@ class Appeal(Base):
     view = Column(Boolean, default=False)
 
     deadline = Column(DateTime)
+    version = Column(Integer, nullable=False, default=0, server_default='0')
 
     tg_appeal_id = Column(Integer, ForeignKey('tg_appeal.id'), nullable=True)
     mahalla_id = Column(Integer, ForeignKey('mahalla.id'))
@@ -130,6 +158,9 @@ class Appeal(Base):
 
 class AppealView(Base):
     __tablename__ = "appeal_view"
+    __table_args__ = (
+        Index('ix_appeal_view_appeal_id_user_id', 'appeal_id', 'user_id'),
+    )
 
     id = Column(Integer, primary_key=True,  index=True, autoincrement=True)
     appeal_id = Column(Integer, ForeignKey("appeal.id"), nullable=False)
@@ -142,6 +173,9 @@ class AppealView(Base):
 
 class AppealHistory(Base):
     __tablename__ = 'appeal_history'
+    __table_args__ = (
+        Index('ix_appeal_history_appeal_id_id', 'appeal_id', 'id'),
+    )
 
     id = Column(Integer, primary_key=True, index=True, autoincrement=True)
     appeal_id = Column(Integer, ForeignKey('appeal.id'), nullable=False)
@@ -161,6 +195,9 @@ class AppealHistory(Base):
 
 class AppealAnswer(Base):
     __tablename__ = 'mekeme_appeal'
+    __table_args__ = (
+        Index('ix_mekeme_appeal_appeal_id_created_at', 'appeal_id', 'created_at'),
+    )
 
     id = Column(Integer, primary_key=True, index=True, autoincrement=True)
     text = Column(String)
@@ -207,6 +244,10 @@ class TgAppealStatus(Enum):
 
 class TgUserAppeal(Base):
     __tablename__ = "tg_appeal"
+    __table_args__ = (
+        Index('ix_tg_appeal_tg_user_id_id', 'tg_user_id', 'id'),
+        Index('ix_tg_appeal_status_id', 'tg_appeal_status', 'id'),
+    )
 
     id = Column(Integer, primary_key=True, index=True, autoincrement=True)
     tg_user_id = Column(BIGINT, ForeignKey('tg_user.tg_user_id'), nullable=False)
@@ -233,6 +274,9 @@ class TgUserAppeal(Base):
 
 class TgAppealHistory(Base):
     __tablename__ = 'tg_appeal_history'
+    __table_args__ = (
+        Index('ix_tg_appeal_history_tg_appeal_id_id', 'tg_appeal_id', 'id'),
+    )
 
     id = Column(Integer, primary_key=True, index=True, autoincrement=True)
     tg_appeal_status = Column(SQLAEnum(TgAppealStatus), default=TgAppealStatus.NEW)
@@ -243,3 +287,139 @@ class TgAppealHistory(Base):
     created_at = Column(DateTime, default=func.now())
 
 
+
+
+
+class ChangeCounter(Base):
+    __tablename__ = 'change_counter'
+
+    name = Column(String, primary_key=True)
+    version = Column(BIGINT, nullable=False, default=0, server_default='0')
+
+
+class AppealDailyStats(Base):
+    # appeals created on `day`, by mekeme, mahalla and their current status (0 = no mekeme / mahalla)
+    __tablename__ = 'appeal_daily_stats'
+
+    day = Column(Date, primary_key=True)
+    mekeme_id = Column(Integer, primary_key=True)
+    mahalla_id = Column(Integer, primary_key=True)
+    status = Column(SQLAEnum(Appeal_Status), primary_key=True)
+    count = Column(Integer, nullable=False, default=0)
+
+
+
+
+# ---- versions behind the ETags in backend/etag.py ----
+# Appeal.version moves on every update of the row, new AppealView rows bump it in
+# backend/views.py together with the view flag; change_counter rows move on any flush that touches a counted table
+
+COUNTED_TABLES = ('sector', 'mahalla', 'mekeme', 'user')
+
+
+@event.listens_for(Appeal, 'before_update')
+def bump_appeal_version(mapper, connection, target):
+    if object_session(target).is_modified(target, include_collections=False):
+        target.version = Appeal.version + 1
+
+
+@event.listens_for(OrmSession, 'after_flush')
+def update_daily_stats(session, flush_context):
+    # keeps appeal_daily_stats in the flushing transaction: a new appeal adds one to its cell,
+    # a deleted one takes one away, a status / mekeme / mahalla change moves it from the old cell
+    # to the new one. appeals without created_at have no cell, as in rollup.backfill
+    deltas = {}
+
+    def add(cell, delta):
+        if cell is not None:
+            deltas[cell] = deltas.get(cell, 0) + delta
+
+    for appeal in chain(session.new, session.dirty, session.deleted):
+        if not isinstance(appeal, Appeal):
+            continue
+
+        if appeal not in session.deleted:
+            add(stats_cell(appeal.created_at, appeal.mekeme_id, appeal.mahalla_id, appeal.appeal_status), 1)
+
+        if appeal not in session.new:
+            state = inspect(appeal)
+            add(stats_cell(*(
+                (state.attrs[name].history.deleted or [getattr(appeal, name)])[0]
+                for name in ('created_at', 'mekeme_id', 'mahalla_id', 'appeal_status')
+            )), -1)
+
+    add_daily_stats(session.connection(), deltas)
+
+
+def stats_cell(created_at, mekeme_id, mahalla_id, appeal_status):
+    if created_at is None:
+        return None
+    return created_at.date(), mekeme_id or 0, mahalla_id or 0, appeal_status or Appeal_Status.WAITING
+
+
+def add_daily_stats(connection, deltas):
+    rows = [
+        {"day": day, "mekeme_id": mekeme_id, "mahalla_id": mahalla_id, "status": status, "count": delta}
+        for (day, mekeme_id, mahalla_id, status), delta in deltas.items() if delta
+    ]
+    if not rows:
+        return
+
+    insert = postgresql.insert if connection.dialect.name == 'postgresql' else sqlite.insert
+    statement = insert(AppealDailyStats.__table__)
+    connection.execute(
+        statement.on_conflict_do_update(
+            index_elements=['day', 'mekeme_id', 'mahalla_id', 'status'],
+            set_={"count": AppealDailyStats.__table__.c["count"] + statement.excluded["count"]}
+        ),
+        rows
+    )
+
+
+@event.listens_for(OrmSession, 'after_flush')
+def bump_change_counters(session, flush_context):
+    names = {obj.__table__.name for obj in chain(session.new, session.dirty, session.deleted)} & set(COUNTED_TABLES)
+    if names:
+        counter = ChangeCounter.__table__
+        session.connection().execute(
+            counter.update().where(counter.c.name.in_(names)).values(version=counter.c.version + 1)
+        )
+
+
+# ---- full text / trigram search indexes (postgres only, queried by backend/search.py) ----
+# literals are inlined with text() so queries render exactly the indexed expressions
+
+def search_document(*columns):
+    document = func.coalesce(columns[0], text("''"))
+    for column in columns[1:]:
+        document = document.concat(text("' '")).concat(func.coalesce(column, text("''")))
+    return document
+
+
+def search_vector(document):
+    return func.to_tsvector(text("'simple'"), document)
+
+
+def search_indexes(name, document):
+    return [
+        Index(f'ix_{name}_search_vector', search_vector(document), postgresql_using='gin').ddl_if(dialect='postgresql'),
+        Index(f'ix_{name}_search_trgm', document.label('document'), postgresql_using='gin',
+              postgresql_ops={'document': 'gin_trgm_ops'}).ddl_if(dialect='postgresql'),
+    ]
+
+
+_appeal = Appeal.__table__.c
+appeal_search_document = search_document(
+    _appeal.fio, _appeal.phone, _appeal.doc_series, _appeal.doc_num,
+    _appeal.doc_series.concat(_appeal.doc_num), _appeal.address, _appeal.text
+)
+
+_tg_appeal = TgUserAppeal.__table__.c
+tg_appeal_search_document = search_document(
+    _tg_appeal.fio, _tg_appeal.phone, _tg_appeal.document, _tg_appeal.address, _tg_appeal.mahalla, _tg_appeal.text
+)
+
+search_indexes('appeal', appeal_search_document)
+search_indexes('tg_appeal', tg_appeal_search_document)
+
+event.listen(Base.metadata, 'before_create', DDL('CREATE EXTENSION IF NOT EXISTS pg_trgm').execute_if(dialect='postgresql'))
@@ -0,0 +1,55 @@
+import json
+import base64
+import binascii
+from fastapi import HTTPException, status
+
+
+# keyset pagination: ?after=<cursor> continues right after the last row of the previous page
+# instead of OFFSET, so deep pages cost the same as the first one
+
+
+def encode_cursor(row_id):
+    raw = json.dumps({"id": row_id}, separators=(',', ':')).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+
+def decode_cursor(cursor):
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        return int(json.loads(raw)["id"])
+    except (binascii.Error, ValueError, KeyError, TypeError):
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid cursor")
+
+
+def paginate(query, key, limit, page=1, after=None, descending=True):
+    if after:
+        last_id = decode_cursor(after)
+        query = query.where(key < last_id if descending else key > last_id)
+    else:
+        query = query.offset((page - 1) * limit)
+
+    return query.order_by(key.desc() if descending else key.asc()).limit(limit)
+
+
+def next_cursor(rows, limit):
+    if len(rows) < limit:
+        return None
+    return encode_cursor(rows[-1].id)
+
+
+# composite keys, e.g. (created_at, kind, id) for the appeal timeline
+
+def encode_keyset(*values):
+    raw = json.dumps(list(values), separators=(',', ':'), default=lambda value: value.isoformat())
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+
+def decode_keyset(cursor, size):
+    try:
+        values = json.loads(base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)))
+    except (binascii.Error, ValueError):
+        values = None
+
+    if not isinstance(values, list) or len(values) != size:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid cursor")
+    return values
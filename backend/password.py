@@ -0,0 +1,39 @@
+import os
+import asyncio
+import bcrypt
+from concurrent.futures import ThreadPoolExecutor
+
+
+BCRYPT_ROUNDS = int(os.getenv('BCRYPT_ROUNDS', 12))
+
+# bcrypt releases the GIL, a small thread pool keeps hashing off the event loop
+executor = ThreadPoolExecutor(max_workers=int(os.getenv('PASSWORD_WORKERS', 4)), thread_name_prefix='bcrypt')
+
+
+def _hash(password):
+    return bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt(rounds=BCRYPT_ROUNDS)).decode('utf-8')
+
+
+def _verify(password, hashed):
+    try:
+        return bcrypt.checkpw(password.encode('utf-8'), hashed.encode('utf-8'))
+    except ValueError:
+        return False
+
+
+async def hash_password(password):
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(executor, _hash, password)
+
+
+async def verify_password(password, hashed):
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(executor, _verify, password, hashed)
+
+
+def needs_rehash(hashed):
+    # $2b$12$<salt+hash>
+    try:
+        return int(hashed.split('$')[2]) != BCRYPT_ROUNDS
+    except (IndexError, ValueError):
+        return True
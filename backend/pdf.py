@@ -0,0 +1,211 @@
+import os
+from io import BytesIO
+from reportlab.pdfgen import canvas
+from reportlab.pdfbase import pdfmetrics
+from reportlab.pdfbase.ttfonts import TTFont
+from reportlab.lib.pagesizes import letter
+
+
+FONT_NAME = 'DejaVuSans'
+FONT_PATH = os.path.abspath(os.path.join(os.path.dirname(__file__), 'DejaVuSans.ttf'))
+
+pdfmetrics.registerFont(TTFont(FONT_NAME, FONT_PATH))
+
+
+class FontMetrics:
+    # per-character advance widths, looked up once per font size.
+    # reportlab sums glyph widths for TTF fonts too, so the totals are identical to stringWidth
+
+    def __init__(self, font_name=FONT_NAME, size=12):
+        self.font = pdfmetrics.getFont(font_name)
+        self.size = size
+        self._widths = {}
+
+    def char_width(self, char):
+        width = self._widths.get(char)
+        if width is None:
+            width = self._widths[char] = self.font.stringWidth(char, self.size)
+        return width
+
+    def width(self, text):
+        return sum(self.char_width(char) for char in text)
+
+
+_metrics = {}
+
+
+def metrics(size=12, font_name=FONT_NAME):
+    key = (font_name, size)
+    if key not in _metrics:
+        _metrics[key] = FontMetrics(font_name, size)
+    return _metrics[key]
+
+
+def split_word(word, max_width, font):
+    # a single word wider than the line is cut into pieces that fit
+    pieces, piece, width = [], '', 0
+    for char in word:
+        char_width = font.char_width(char)
+        if piece and width + char_width > max_width:
+            pieces.append((piece, width))
+            piece, width = '', 0
+        piece += char
+        width += char_width
+    pieces.append((piece, width))
+    return pieces
+
+
+def wrap(text, max_width, font):
+    # greedy wrap, every word is measured once; line breaks in the text are kept
+    lines = []
+    space = font.char_width(' ')
+
+    for paragraph in (text or '').splitlines():
+        words, line_width = [], 0
+
+        for word in paragraph.split():
+            width = font.width(word)
+            for piece, width in (split_word(word, max_width, font) if width > max_width else [(word, width)]):
+                if words and line_width + space + width > max_width:
+                    lines.append(' '.join(words))
+                    words, line_width = [], 0
+                line_width += (space if words else 0) + width
+                words.append(piece)
+
+        lines.append(' '.join(words))
+
+    while lines and not lines[-1]:
+        lines.pop()
+    return lines
+
+
+class PdfDocument:
+    # y cursor over letter-size pages, starts a new page whenever the next block does not fit
+
+    def __init__(self, pagesize=letter, top=750, bottom=50):
+        self.buffer = BytesIO()
+        self.canvas = canvas.Canvas(self.buffer, pagesize=pagesize)
+        self.page_width, self.page_height = pagesize
+        self.top = top
+        self.bottom = bottom
+        self.y = top
+        self.size = None
+        self.font(12)
+
+    def font(self, size):
+        if size != self.size:
+            self.size = size
+            self.canvas.setFont(FONT_NAME, size)
+        return metrics(size)
+
+    def page_break(self):
+        size, self.size = self.size, None
+        self.canvas.showPage()
+        self.font(size)
+        self.y = self.top
+
+    def ensure(self, height):
+        if self.y - height < self.bottom:
+            self.page_break()
+
+    def skip(self, height):
+        self.y -= height
+
+    def centered(self, text, size=12, line_height=15):
+        self.font(size)
+        self.ensure(line_height)
+        self.canvas.drawCentredString(self.page_width / 2, self.y, text)
+        self.y -= line_height
+
+    def table_row(self, cells, col_widths, x=50, line_height=20, padding=5):
+        # the last column wraps, a row split by a page break continues at the top of the next page
+        font = self.font(12)
+        lines = wrap(cells[-1], col_widths[-1] - 2 * padding, font) or ['']
+
+        # a row that fits on one page is never split
+        if len(lines) * line_height > self.y - self.bottom and len(lines) * line_height <= self.top - self.bottom:
+            self.page_break()
+
+        first = True
+        while True:
+            fit = max(1, int((self.y - self.bottom) // line_height))
+            chunk, lines = lines[:fit], lines[fit:]
+            height = len(chunk) * line_height
+            bottom = self.y - height
+
+            left = x
+            for width in col_widths:
+                self.canvas.rect(left, bottom, width, height)
+                left += width
+
+            left = x
+            for text, width in zip(cells[:-1], col_widths):
+                if first:
+                    self.canvas.drawString(left + padding, self.y - line_height + padding, text)
+                left += width
+
+            for index, line in enumerate(chunk):
+                self.canvas.drawString(left + padding, self.y - (index + 1) * line_height + padding, line)
+
+            self.y = bottom
+            first = False
+            if not lines:
+                break
+            self.page_break()
+
+    def paragraph(self, text, max_width=500, size=12, line_height=20, align='center'):
+        font = self.font(size)
+        for line in wrap(text, max_width, font):
+            self.ensure(line_height)
+            if align == 'center':
+                self.canvas.drawString((self.page_width - font.width(line)) / 2, self.y, line)
+            else:
+                self.canvas.drawString((self.page_width - max_width) / 2, self.y, line)
+            self.y -= line_height
+
+    def render(self):
+        self.canvas.showPage()
+        self.canvas.save()
+        return self.buffer.getvalue()
+
+
+APPEAL_COL_WIDTHS = [30, 150, 400]
+
+
+def appeal_document(appeal, text):
+    # everything the pdf shows, as plain values: rendering needs no session and the result
+    # depends on nothing else
+    return {
+        "id": appeal.id,
+        "headers": [
+            ("ID", appeal.id),
+            ("FAA", appeal.fio),
+            ("JINS", appeal.gender.value if appeal.gender else "N/A"),
+            ("TELEFON NOMER", appeal.phone),
+            ("PASSPORT SERIYA", appeal.doc_series),
+            ("PASSPORT NOMER", appeal.doc_num),
+            ("ADDRESS", appeal.address),
+            ("TUWILG'AN KU'N", appeal.birthday.strftime("%Y.%m.%d") if appeal.birthday else "N/A"),
+            ("JUWAPKER SHO'LKEM", appeal.mekeme.name if appeal.mekeme else "N/A"),
+            ("KELIP TU'SKEN WAQTI", appeal.created_at.strftime("%d.%m.%Y %H:%M")),
+            ("MA'HA'LLE", appeal.mahalla.name if appeal.mahalla else "N/A"),
+            ("SEKTOR", appeal.mahalla.sector.name if appeal.mahalla and appeal.mahalla.sector else "N/A"),
+        ],
+        "text": text,
+    }
+
+
+def render_appeal(document):
+    pdf = PdfDocument()
+
+    pdf.centered("QON'IRAT HA'KIMLIGI")
+    pdf.centered("«QON'IRAT MURAJAATI» platformasi arqali kelip tusken murajaat")
+
+    for index, (header, value) in enumerate(document["headers"], start=1):
+        pdf.table_row([str(index), str(header), str(value)], APPEAL_COL_WIDTHS)
+
+    pdf.skip(40)
+    pdf.centered("MURAJAAT XAT", size=14, line_height=50)
+    pdf.paragraph(document["text"])
+
+    return pdf.render()
@@ -0,0 +1,89 @@
+import os
+import re
+import time
+import hashlib
+import aiofiles
+from backend.pdf import render_appeal
+from backend.workers import worker_pool
+
+
+# rendered appeal pdfs on local disk, named appeal_<id>_<hash of the rendered document>.pdf.
+# any change to a printed field gives a new name, so a stored file is never stale. older versions
+# are not removed right away, a response or dossier may still be reading them: sweep() drops every
+# version but the latest one of an appeal once it is older than grace seconds
+
+LAYOUT_VERSION = 1
+
+CACHED_FILE = re.compile(r'appeal_(\d+)_[0-9a-f]+\.pdf$')
+
+
+class PdfCache:
+
+    def __init__(self, directory='pdf-cache', grace=3600, sweep_interval=300):
+        self.directory = directory
+        self.grace = grace
+        self.sweep_interval = sweep_interval
+        self._swept_at = time.monotonic()
+
+    def path(self, document):
+        digest = hashlib.blake2b(repr((LAYOUT_VERSION, document)).encode(), digest_size=16).hexdigest()
+        return os.path.join(self.directory, f"appeal_{document['id']}_{digest}.pdf")
+
+    def get(self, document):
+        path = self.path(document)
+        try:
+            # a hit makes the version the latest one again, e.g. after an edit was reverted
+            os.utime(path)
+        except OSError:
+            return None
+        return path
+
+    async def put(self, document, content):
+        os.makedirs(self.directory, exist_ok=True)
+        path = self.path(document)
+        part = f"{path}.{os.getpid()}.part"
+
+        async with aiofiles.open(part, 'wb') as output:
+            await output.write(content)
+        os.replace(part, path)
+
+        if time.monotonic() - self._swept_at > self.sweep_interval:
+            self.sweep()
+        return path
+
+    def sweep(self):
+        self._swept_at = time.monotonic()
+        if not os.path.isdir(self.directory):
+            return
+
+        versions = {}
+        for entry in os.scandir(self.directory):
+            match = CACHED_FILE.match(entry.name)
+            if match:
+                try:
+                    versions.setdefault(match.group(1), []).append((entry.stat().st_mtime, entry.path))
+                except FileNotFoundError:
+                    pass
+
+        expired = time.time() - self.grace
+        for files in versions.values():
+            files.sort()
+            for mtime, path in files[:-1]:
+                if mtime < expired:
+                    try:
+                        os.remove(path)
+                    except FileNotFoundError:
+                        pass
+
+
+pdf_cache = PdfCache(
+    os.getenv('PDF_CACHE_DIR', 'pdf-cache'),
+    grace=int(os.getenv('PDF_CACHE_GRACE', 3600))
+)
+
+
+async def appeal_pdf(document):
+    path = pdf_cache.get(document)
+    if path is None:
+        path = await pdf_cache.put(document, await worker_pool.run(render_appeal, document))
+    return path
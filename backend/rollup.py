@@ -0,0 +1,66 @@
+import argparse
+from sqlalchemy import select, delete, insert, func, cast, literal, literal_column, Date
+from backend.database import ENGINE
+from backend.model import Appeal, Appeal_Status, AppealDailyStats
+
+
+# appeal_daily_stats is kept current by the flush listener in backend/model.py;
+# backfill() rebuilds it from the appeal table (python -m backend.rollup backfill)
+
+GRANULARITIES = ('day', 'week', 'month')
+
+
+def day_of(column, dialect):
+    if dialect == 'postgresql':
+        return cast(column, Date)
+    return func.date(column, type_=Date)
+
+
+def period_of(day, granularity, dialect):
+    if dialect == 'postgresql':
+        # inlined so SELECT and GROUP BY render the same expression
+        return cast(func.date_trunc(literal_column(f"'{granularity}'"), day), Date)
+    if granularity == 'week':
+        # monday of the week
+        return func.date(day, 'weekday 0', '-6 days', type_=Date)
+    if granularity == 'month':
+        return func.date(day, 'start of month', type_=Date)
+    return day
+
+
+def backfill(connection):
+    table = AppealDailyStats.__table__
+    day = day_of(Appeal.created_at, connection.dialect.name)
+    mekeme_id = func.coalesce(Appeal.mekeme_id, 0)
+    mahalla_id = func.coalesce(Appeal.mahalla_id, 0)
+    status = func.coalesce(Appeal.appeal_status, literal(Appeal_Status.WAITING, Appeal.appeal_status.type))
+
+    connection.execute(delete(table))
+    return connection.execute(insert(table).from_select(
+        ['day', 'mekeme_id', 'mahalla_id', 'status', 'count'],
+        select(day, mekeme_id, mahalla_id, status, func.count(Appeal.id))
+        .where(Appeal.created_at.is_not(None))
+        .group_by(day, mekeme_id, mahalla_id, status)
+    )).rowcount
+
+
+def series_query(granularity, dialect, from_day, to_day, mekeme_id=None, mahalla_id=None):
+    period = period_of(AppealDailyStats.day, granularity, dialect).label('period')
+    query = select(period, AppealDailyStats.status, func.sum(AppealDailyStats.count).label('count')) \
+        .where(AppealDailyStats.day >= from_day, AppealDailyStats.day <= to_day)
+
+    if mekeme_id is not None:
+        query = query.where(AppealDailyStats.mekeme_id == mekeme_id)
+    if mahalla_id is not None:
+        query = query.where(AppealDailyStats.mahalla_id == mahalla_id)
+
+    return query.group_by(period, AppealDailyStats.status).order_by(period)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(prog='python -m backend.rollup')
+    parser.add_argument('command', choices=['backfill'])
+    parser.parse_args()
+
+    with ENGINE.begin() as connection:
+        print(f'appeal_daily_stats: {backfill(connection)} rows')
@@ -1,23 +1,29 @@
 import os, re, aiofiles, uuid, datetime, logging
-import pandas as pd
-from sqlalchemy import desc
-from fastapi import APIRouter, HTTPException, status, Depends, File, UploadFile, Query, Response
-from starlette.responses import StreamingResponse
-from backend.database import Session, connect
+from sqlalchemy import desc, select
+from sqlalchemy.orm import selectinload
+from fastapi import APIRouter, HTTPException, status, Depends, File, UploadFile, Query, Response, Request
+from fastapi.responses import FileResponse, StreamingResponse
+from backend.database import AsyncSession, connect
 from fastapi.encoders import jsonable_encoder
 from fastapi_jwt_auth import AuthJWT
-from backend.model import Tg_user, Appeal_Status, Appeal, AppealHistory,  AppealAnswer, User, User_Status, AppealHakimiyat, TgUserAppeal, TgAppealStatus, AppealView, TgAppealHistory
-from typing import Optional, Union
+from backend.model import Tg_user, Appeal_Status, Appeal, AppealHistory,  AppealAnswer, User, User_Status, AppealHakimiyat, TgUserAppeal, TgAppealStatus, AppealView, TgAppealHistory, Mahalla, Mekeme
+from typing import Optional, Union, Literal, List
 from backend.schema import AppealCreateSchema, AppealAnswerCreateSchema, AppealHakimiyatSchema, AppealUpdateSchema
 from datetime import datetime, timedelta
-from io import BytesIO
-from reportlab.pdfgen import canvas
-from reportlab.pdfbase import pdfmetrics
-from reportlab.pdfbase.ttfonts import TTFont
-from reportlab.lib.pagesizes import letter
-from openpyxl.styles import Alignment
+from types import SimpleNamespace
 
 from backend.routers.auth import verify
+from backend.pagination import paginate, next_cursor
+from backend.totals import count_total, invalidate
+from backend.search import search_filter, search_rank
+from backend.etag import counter, make_etag, etag_matches, set_etag, not_modified
+from backend.views import view_buffer
+from backend.timeline import timeline_query, timeline_page, timeline_cursor
+from backend.pdf import appeal_document
+from backend.pdf_cache import appeal_pdf
+from backend.dossier import dossier_stream
+from backend.export import APPEAL_COLUMNS, appeal_export_query, has_rows, export_response
+from backend.serializers import ORJSONResponse, appeal_list_item, appeal_detail, appeal_viewer, appeal_history_item, appeal_timeline_item
 
 
 
@@ -27,13 +33,6 @@ appeal_router = APIRouter(prefix='/appeal', tags=['APPEAL'])
 UPLOAD_DIR = "appeal-files/"
 
 
-font_path = os.path.join(os.path.dirname(__file__), '..', 'DejaVuSans.ttf')
-font_path = os.path.abspath(font_path)
-
-
-pdfmetrics.registerFont(TTFont('DejaVuSans', font_path))
-
-
 def strip_html_tags(text):
     if text:
         clean = re.sub(r'<[^>]*>', '', text)
@@ -41,96 +40,23 @@ def strip_html_tags(text):
     return text
 
 
-def get_text_width(c, text, font_size=12):
-    c.setFont("DejaVuSans", font_size)
-    return c.stringWidth(text)
-
-
-def wrap_text(c, text, max_width):
-    c.setFont("DejaVuSans", 12)
-    lines = []
-    words = text.split()
-    current_line = words[0]
-    for word in words[1:]:
-        if get_text_width(c, current_line + " " + word) <= max_width:
-            current_line += " " + word
-        else:
-            lines.append(current_line)
-            current_line = word
-    lines.append(current_line)
-    return lines
-
-
 @appeal_router.get('/pdf/{id}', status_code=200)
-async def download_pdf(id: int, session: Session = Depends(connect),  user : User = Depends(verify)):
+async def download_pdf(id: int, session: AsyncSession = Depends(connect),  user : User = Depends(verify)):
     try:
 
         if user.role not in [User_Status.CEO, User_Status.ADMIN]:
             raise HTTPException(status_code=status.HTTP_403_FORBIDDEN)
 
-        appeal = session.query(Appeal).filter(Appeal.id == id).first()
+        appeal = await session.scalar(
+            select(Appeal)
+            .options(selectinload(Appeal.mekeme), selectinload(Appeal.mahalla).selectinload(Mahalla.sector))
+            .where(Appeal.id == id)
+        )
         if not appeal:
             raise HTTPException(status_code=404, detail="Appeal not found")
 
-        buffer = BytesIO()
-        c = canvas.Canvas(buffer, pagesize=letter)
-        page_width, page_height = letter
-
-        c.setFont("DejaVuSans", 12)
-        c.drawCentredString(page_width / 2, 750, "QON'IRAT HA'KIMLIGI")
-        c.drawCentredString(page_width / 2, 735, "«QON'IRAT MURAJAATI» platformasi arqali kelip tusken murajaat")
-
-        y_position = 700
-        headers = [
-            ("ID", appeal.id),
-            ("FAA", appeal.fio),
-            ("JINS", appeal.gender.value if appeal.gender else "N/A"),
-            ("TELEFON NOMER", appeal.phone),
-            ("PASSPORT SERIYA", appeal.doc_series),
-            ("PASSPORT NOMER", appeal.doc_num),
-            ("ADDRESS", appeal.address),
-            ("TUWILG'AN KU'N", appeal.birthday.strftime("%Y.%m.%d") if appeal.birthday else "N/A"),
-            ("JUWAPKER SHO'LKEM", appeal.mekeme.name if appeal.mekeme else "N/A"),
-            ("KELIP TU'SKEN WAQTI", appeal.created_at.strftime("%d.%m.%Y %H:%M")),
-            ("MA'HA'LLE", appeal.mahalla.name if appeal.mahalla else "N/A"),
-            ("SEKTOR", appeal.mahalla.sector.name if appeal.mahalla and appeal.mahalla.sector else "N/A")
-        ]
-
-        col_widths = [30, 150, 400]
-        line_height = 20
-
-        for i, (header, value) in enumerate(headers, start=1):
-            wrapped_text = wrap_text(c, str(value), col_widths[2]) if isinstance(value, str) else [str(value)]
-            for line in wrapped_text:
-
-                c.rect(50, y_position, col_widths[0], line_height)
-                c.rect(80, y_position, col_widths[1], line_height)
-                c.rect(230, y_position, col_widths[2], line_height)
-                c.rect(50, y_position, sum(col_widths), line_height)
-                c.drawString(55, y_position + 5, str(i))
-                c.drawString(85, y_position + 5, str(header))
-                c.drawString(235, y_position + 5, line)
-                y_position -= line_height
-
-        c.setFont("DejaVuSans", 14)
-        y_position -= 20
-        c.drawCentredString(page_width / 2, y_position, "MURAJAAT XAT")
-        y_position -= 20
-
-        appeal_text = strip_html_tags(appeal.text)
-        wrapped_text = wrap_text(c, appeal_text, 500)
-
-        text_y_position = y_position - 30
-        for line in wrapped_text:
-            text_width = get_text_width(c, line)
-            c.drawString((page_width - text_width) / 2, text_y_position, line)
-            text_y_position -= line_height
-
-        c.showPage()
-        c.save()
-
-        buffer.seek(0)
-        return StreamingResponse(buffer, media_type="application/pdf", headers={
+        document = appeal_document(appeal, strip_html_tags(appeal.text))
+        return FileResponse(await appeal_pdf(document), media_type="application/pdf", headers={
             "Content-Disposition": f"attachment; filename=appeal_{id}.pdf"
         })
 
@@ -160,87 +86,25 @@ async def download_appeals_excel(
         from_date: Optional[str] = Query(None),
         to_date: Optional[str] = Query(None),
         status: Optional[str] = Query(None),
-        session: Session = Depends(connect),
+        format: Literal['xlsx', 'csv', 'parquet'] = Query('xlsx'),
+        session: AsyncSession = Depends(connect),
         user : User = Depends(verify)):
     try:
 
 
 
-        appeals_query = session.query(Appeal)
-        if user.role not in [User_Status.CEO, User_Status.ADMIN]:
-            appeals_query = appeals_query.filter(Appeal.mekeme_id == user.mekeme_id)
-
-        if mekeme_id:
-            appeals_query = appeals_query.filter(Appeal.mekeme_id == mekeme_id)
         if from_date:
             from_date = parse_date(from_date).replace(hour=0, minute=0, second=0)
-            appeals_query = appeals_query.filter(Appeal.created_at >= from_date)
         if to_date:
             to_date = parse_date(to_date).replace(hour=23, minute=59, second=59)
-            appeals_query = appeals_query.filter(Appeal.created_at <= to_date)
-        if status:
-            if status == 'done':
-                appeals_query = appeals_query.filter(
-                    Appeal.appeal_status.in_([Appeal_Status.SUCCESS_DONE, Appeal_Status.TEXT_DONE]))
-            else:
-                appeals_query = appeals_query.filter(Appeal.appeal_status == status.upper())
 
-        appeals_query = appeals_query.order_by(Appeal.id.desc())
-        appeals = appeals_query.all()
+        scope = None if user.role in [User_Status.CEO, User_Status.ADMIN] else user.mekeme_id
+        query = appeal_export_query(scope, mekeme_id, from_date, to_date, status)
 
-        if not appeals:
+        if not await has_rows(session, query):
             raise HTTPException(status_code=404, detail="Данные не найдены для выгрузки.")
 
-        data = [
-            {
-                "ID": appeal.id,
-                "ФИО": appeal.fio,
-                "Пол": 'erkek' if appeal.gender.value == 'male' else "ayel",
-                "Телефон номер": appeal.phone,
-                "Серия документа": appeal.doc_series,
-                "Документ №": appeal.doc_num,
-                "Махалля" : appeal.mahalla.name,
-                "Адрес": appeal.address,
-                "Дата рождения": appeal.birthday.strftime('%d.%m.%Y'),
-                "Создано": appeal.created_at.strftime('%H:%M %d.%m.%Y'),
-                "Статус" : appeal.appeal_status.value,
-                "сектор" : appeal.mahalla.sector.name,
-                "Организация (куда отправлено обращение гражданина)" : appeal.mekeme.name
-            }
-            for appeal in appeals
-        ]
-
-        df = pd.DataFrame(data)
-
-        output = BytesIO()
-        with pd.ExcelWriter(output, engine='openpyxl') as writer:
-            df.to_excel(writer, sheet_name='Appeals', index=False)
-            worksheet = writer.sheets['Appeals']
-
-            for column_cells in worksheet.columns:
-                max_length = max(len(str(cell.value)) for cell in column_cells)
-                column_letter = column_cells[0].column_letter
-                worksheet.column_dimensions[column_letter].width = max_length + 5
-                for cell in column_cells:
-                    if cell.column_letter == 'I':
-                        cell.alignment = Alignment(wrap_text=True, vertical='top', horizontal='left')
-                    else:
-                        cell.alignment = Alignment(wrap_text=True, vertical='center', horizontal='center')
-
-            for row in worksheet.iter_rows(min_row=2, max_row=worksheet.max_row):
-                text_cell = row[8]
-                if isinstance(text_cell.value, str) and len(text_cell.value) > 50:
-                    line_count = text_cell.value.count('\n') + 1
-                    worksheet.row_dimensions[text_cell.row].height = max(20, line_count * 20)
-
-        output.seek(0)
-
-        headers = {
-            'Content-Disposition': 'attachment; filename="appeals.xlsx"',
-            'Content-Type': 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
-        }
-        return Response(content=output.getvalue(), headers=headers,
-                        media_type='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet')
+        return export_response(query, APPEAL_COLUMNS, format, 'appeals')
 
 
     except Exception as e:
@@ -304,6 +168,64 @@ logger = logging.getLogger(__name__)
 
 
 
+def appeal_list_query(*columns):
+    return select(
+        Appeal.id,
+        Appeal.address,
+        Appeal.deadline,
+        Appeal.text,
+        Appeal.phone,
+        Appeal.appeal_status,
+        Appeal.created_at,
+        Appeal.tg_appeal_id,
+        Appeal.fio,
+        Mahalla.name.label('mahalla_name'),
+        *columns
+    ).outerjoin(Mahalla, Mahalla.id == Appeal.mahalla_id)
+
+
+
+@appeal_router.get('/dossier', status_code=200)
+async def download_dossier(
+        ids: Optional[List[int]] = Query(None),
+        mekeme_id: Optional[int] = Query(None),
+        from_date: Optional[str] = Query(None),
+        to_date: Optional[str] = Query(None),
+        status: Optional[str] = Query(None),
+        session: AsyncSession = Depends(connect),
+        user : User = Depends(verify)):
+    try:
+
+        if user.role not in [User_Status.CEO, User_Status.ADMIN]:
+            raise HTTPException(status_code=403)
+
+        if ids:
+            query = select(Appeal.id).where(Appeal.id.in_(ids)).order_by(Appeal.id.desc())
+        else:
+            if from_date:
+                from_date = parse_date(from_date).replace(hour=0, minute=0, second=0)
+            if to_date:
+                to_date = parse_date(to_date).replace(hour=23, minute=59, second=59)
+            query = appeal_export_query(None, mekeme_id, from_date, to_date, status).with_only_columns(Appeal.id)
+
+        appeal_ids = (await session.scalars(query)).all()
+        if not appeal_ids:
+            raise HTTPException(status_code=404, detail="Данные не найдены для выгрузки.")
+
+        return StreamingResponse(
+            dossier_stream(appeal_ids, lambda appeal: appeal_document(appeal, strip_html_tags(appeal.text)), UPLOAD_DIR),
+            media_type='application/zip',
+            headers={'Content-Disposition': 'attachment; filename="appeals.zip"'}
+        )
+
+    except HTTPException as http_exc:
+        raise http_exc
+    except Exception as e:
+        raise HTTPException(status_code=400)
+
+
+
+
 @appeal_router.get('', status_code=200)
 async def get_appeals(
         limit: int = Query(10, ge=1),
@@ -313,81 +235,106 @@ async def get_appeals(
         to_date: Optional[str] = Query(None),
         status: Optional[str] = Query(None),
         appeal : Union[int, str] = Query(None),
-        session : Session = Depends(connect),
+        after: Optional[str] = Query(None),
+        count: bool = Query(True),
+        estimate: bool = Query(False),
+        session : AsyncSession = Depends(connect),
         user : User = Depends(verify)
 ):
     try:
 
 
 
-        if user.role in [User_Status.CEO, User_Status.ADMIN]:
-            appeals_query = session.query(Appeal)
-        else:
-            appeals_query = session.query(Appeal).filter(Appeal.mekeme_id == user.mekeme_id)
+        appeals_query = appeal_list_query()
+
+        if user.role not in [User_Status.CEO, User_Status.ADMIN]:
+            appeals_query = appeals_query.where(Appeal.mekeme_id == user.mekeme_id)
 
         if isinstance(appeal, int):
-            appeals_query = appeals_query.filter(Appeal.id == appeal)
+            appeals_query = appeals_query.where(Appeal.id == appeal)
 
         elif isinstance(appeal, str):
-            appeals_query = appeals_query.filter(Appeal.fio.ilike(f"%{appeal}%"))
+            appeals_query = appeals_query.where(search_filter(Appeal, appeal, session.bind.dialect.name))
 
         if mekeme_id:
-            appeals_query = appeals_query.filter(Appeal.mekeme_id == mekeme_id)
+            appeals_query = appeals_query.where(Appeal.mekeme_id == mekeme_id)
 
         if from_date:
             from_date = datetime.strptime(from_date, "%d.%m.%y").replace(hour=0, minute=0, second=0)
-            appeals_query = appeals_query.filter(Appeal.created_at >= from_date)
+            appeals_query = appeals_query.where(Appeal.created_at >= from_date)
 
         if to_date:
             to_date = datetime.strptime(to_date, "%d.%m.%y").replace(hour=23, minute=59, second=59)
-            appeals_query = appeals_query.filter(Appeal.created_at <= to_date)
+            appeals_query = appeals_query.where(Appeal.created_at <= to_date)
 
         if status:
 
             if status == 'done':
-                appeals_query = appeals_query.filter(
+                appeals_query = appeals_query.where(
                     Appeal.appeal_status.in_([Appeal_Status.SUCCESS_DONE, Appeal_Status.TEXT_DONE])
                 )
             else:
                 try:
 
                     status_enum = Appeal_Status[status.upper()]
-                    appeals_query = appeals_query.filter(Appeal.appeal_status == status_enum)
+                    appeals_query = appeals_query.where(Appeal.appeal_status == status_enum)
                 except KeyError:
                     raise HTTPException(status_code=400, detail="Invalid appeal status")
 
-        appeals_query = appeals_query.order_by(Appeal.id.desc())
-
-        total = appeals_query.count()
-        skip = (page - 1) * limit
-        appeals = appeals_query.offset(skip).limit(limit).all()
-
-        dataa = [
-            {
-                "id": appeal.id,
-                "address": f"{appeal.mahalla.name} - {appeal.address}",
-                "deadline" : appeal.deadline,
-                "text": appeal.text,
-                "phone": appeal.phone,
-                "appeal_status": appeal.appeal_status,
-                "created_at": appeal.created_at.strftime("%d:%m:%Y %H:%M"),
-                "tg_appeal_id": appeal.tg_appeal_id if appeal.tg_appeal_id else None,
-                "fio": appeal.fio
-            }
-        for appeal in appeals
-        ]
+        scope = None if user.role in [User_Status.CEO, User_Status.ADMIN] else user.mekeme_id
+        filters = (scope, appeal, mekeme_id, status, from_date, to_date)
+        total = await count_total(session, 'appeal', appeals_query, filters, estimate) if count else None
+
+        appeals = (await session.execute(paginate(appeals_query, Appeal.id, limit, page, after))).all()
+
+        dataa = [appeal_list_item(appeal) for appeal in appeals]
 
         pagination = {
             "page": page,
             "limit": limit,
-            "total": total
+            "total": total,
+            "next": next_cursor(appeals, limit)
         }
         data = {
             "data": dataa,
             "pagination": pagination
         }
 
-        return jsonable_encoder(data)
+        return ORJSONResponse(data)
+
+    except Exception as e:
+        raise HTTPException(status_code=400)
+
+
+
+
+
+@appeal_router.get('/search', status_code=200)
+async def search_appeals(
+        q: str = Query(..., min_length=2),
+        limit: int = Query(20, ge=1, le=100),
+        mekeme_id: Optional[int] = Query(None),
+        session : AsyncSession = Depends(connect),
+        user : User = Depends(verify)
+):
+    try:
+
+        dialect = session.bind.dialect.name
+        rank = search_rank(Appeal, q, dialect).label('rank')
+
+        query = appeal_list_query(rank).where(search_filter(Appeal, q, dialect))
+
+        if user.role not in [User_Status.CEO, User_Status.ADMIN]:
+            query = query.where(Appeal.mekeme_id == user.mekeme_id)
+
+        if mekeme_id:
+            query = query.where(Appeal.mekeme_id == mekeme_id)
+
+        appeals = (await session.execute(query.order_by(rank.desc(), Appeal.id.desc()).limit(limit))).all()
+
+        data = [dict(appeal_list_item(appeal), rank=appeal.rank) for appeal in appeals]
+
+        return ORJSONResponse(data)
 
     except Exception as e:
         raise HTTPException(status_code=400)
@@ -396,68 +343,57 @@ async def get_appeals(
 
 
 
+def appeal_state(id):
+    # what the detail payload depends on: the row with its viewers (Appeal.version) and mahalla, mekeme and user names
+    return select(Appeal.mekeme_id, Appeal.version, counter('mahalla'), counter('mekeme'), counter('user')).where(Appeal.id == id)
+
+
 @appeal_router.get('/{id}', status_code=200)
-async def get_appeal(id: int, session : Session = Depends(connect), user : User = Depends(verify)):
+async def get_appeal(id: int, request: Request, session : AsyncSession = Depends(connect), user : User = Depends(verify)):
     try:
         if not verify:
             raise HTTPException(status_code=404, detail="Пользователь не найден")
 
-        appeal = session.query(Appeal).filter(Appeal.id == id).first()
-        if not appeal:
+        state = (await session.execute(appeal_state(id))).first()
+        if not state:
             raise HTTPException(status_code=404, detail="Обращение не найдено")
 
         if user.role not in [User_Status.CEO, User_Status.ADMIN]:
-            if user.mekeme_id != appeal.mekeme_id:
+            if user.mekeme_id != state.mekeme_id:
                 raise HTTPException(status_code=403)
 
-        check_view = session.query(AppealView).filter_by(appeal_id=appeal.id, user_id=user.id).first()
-        if not check_view:
-            new_view = AppealView(appeal_id=appeal.id, user_id=user.id)
-            session.add(new_view)
-
-            if not appeal.view:
-                appeal.view = True
+        etag = make_etag(user.id, *state)
+        if etag_matches(request, etag):
+            return not_modified(etag)
 
-            session.commit()
+        appeal = await session.scalar(
+            select(Appeal)
+            .options(selectinload(Appeal.mahalla), selectinload(Appeal.mekeme))
+            .where(Appeal.id == id)
+        )
+        if not appeal:
+            raise HTTPException(status_code=404, detail="Обращение не найдено")
 
-        viewers = [
-            {   "user_id" : view.user.id,
-                "user": view.user.fio,
-                "time": view.viewed_at.strftime("%d-%m-%Y %H:%M")
-            }
-            for view in appeal.views
-        ]
+        views = (await session.scalars(
+            select(AppealView).options(selectinload(AppealView.user)).where(AppealView.appeal_id == appeal.id)
+        )).all()
+        viewers = [appeal_viewer(view) for view in views]
 
+        # this open counts as a view even before the buffer writes it
+        data = appeal_detail(appeal)
+        data["view"] = True
 
-        data = {
-            "id": appeal.id,
-            "fio": appeal.fio,
-            "gender": appeal.gender.value,
-            "phone": appeal.phone,
-            "doc_series": appeal.doc_series,
-            "doc_num": appeal.doc_num,
-            "address": appeal.address,
-            "birthday": appeal.birthday,
-            "file_path": appeal.file_path,
-            "text": appeal.text,
-            "created_at": appeal.created_at,
-            "updated_at": appeal.updated_at,
-            "mahalla": appeal.mahalla.name if appeal.mahalla else None,
-            "mahalla_id": appeal.mahalla_id,
-            "mekeme": appeal.mekeme.name if appeal.mekeme else None,
-            "mekeme_id": appeal.mekeme_id,
-            "appeal_status": appeal.appeal_status.value,
-            "deadline": appeal.deadline,
-            "view": appeal.view,
-            "tg_appeal_id" : appeal.tg_appeal_id if appeal.tg_appeal_id else None
-        }
+        # first open by this user: recorded by the view buffer, shown right away
+        if all(view.user_id != user.id for view in views):
+            viewed_at = view_buffer.add(appeal.id, user.id)
+            viewers.append(appeal_viewer(SimpleNamespace(user=user, viewed_at=viewed_at)))
 
         response = {
                 "data" : data,
                 "view" : viewers
             }
 
-        return jsonable_encoder(response)
+        return set_etag(ORJSONResponse(response), etag)
 
     except HTTPException as http_err:
         raise http_err
@@ -472,7 +408,7 @@ async def get_appeal(id: int, session : Session = Depends(connect), user : User
 
 
 @appeal_router.post("", status_code=status.HTTP_201_CREATED)
-async def create_appeal(appeal: AppealCreateSchema, session: Session = Depends(connect), user : User = Depends(verify)):
+async def create_appeal(appeal: AppealCreateSchema, session: AsyncSession = Depends(connect), user : User = Depends(verify)):
     try:
 
 
@@ -480,13 +416,13 @@ async def create_appeal(appeal: AppealCreateSchema, session: Session = Depends(c
             raise HTTPException(status_code=status.HTTP_403_FORBIDDEN)
 
 
-        tg_appeal = session.query(TgUserAppeal).filter(TgUserAppeal.id == appeal.tg_appeal_id).first()
+        tg_appeal = await session.scalar(select(TgUserAppeal).where(TgUserAppeal.id == appeal.tg_appeal_id))
         if tg_appeal and tg_appeal.tg_appeal_status == TgAppealStatus.CANCELED:
             raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="This appeal was canceled.")
 
 
         if appeal.tg_appeal_id is not None:
-            check_appeal = session.query(Appeal).filter(Appeal.tg_appeal_id == appeal.tg_appeal_id).first()
+            check_appeal = await session.scalar(select(Appeal).where(Appeal.tg_appeal_id == appeal.tg_appeal_id))
             if check_appeal:
                 raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail="Appeal with this tg_appeal_id already exists.")
 
@@ -507,7 +443,8 @@ async def create_appeal(appeal: AppealCreateSchema, session: Session = Depends(c
         )
 
         session.add(new_appeal)
-        session.flush()
+        await session.flush()
+        await session.refresh(new_appeal, ['created_at', 'mekeme'])
 
 
         appeal_history = AppealHistory(
@@ -536,8 +473,9 @@ async def create_appeal(appeal: AppealCreateSchema, session: Session = Depends(c
         new_appeal.deadline = new_appeal.created_at + timedelta(days=15)
 
 
-        session.commit()
-        session.refresh(new_appeal)
+        await session.commit()
+        await session.refresh(new_appeal)
+        invalidate('appeal', 'tg_appeal')
 
 
 
@@ -561,7 +499,7 @@ async def create_appeal(appeal: AppealCreateSchema, session: Session = Depends(c
         raise http
 
     except Exception as e:
-        session.rollback()
+        await session.rollback()
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=f"Error: {e}")
 
 
@@ -574,13 +512,13 @@ async def create_appeal(appeal: AppealCreateSchema, session: Session = Depends(c
 @appeal_router.post('/mekeme-appeal', status_code=status.HTTP_200_OK)
 async def mekeme_appeal_answer(
     appeal: AppealAnswerCreateSchema,
-    session : Session = Depends(connect),
+    session : AsyncSession = Depends(connect),
     user : User = Depends(verify)
 ):
     try:
 
 
-        check_appeal = session.query(Appeal).filter(Appeal.id == appeal.appeal_id).first()
+        check_appeal = await session.scalar(select(Appeal).where(Appeal.id == appeal.appeal_id))
 
 
 
@@ -690,14 +628,16 @@ async def mekeme_appeal_answer(
             report_photo=appeal.report_photo
         )
         session.add(appeal_history)
-        session.commit()
+        await session.commit()
+        await session.refresh(new_app_answer)
+        invalidate('appeal')
 
         return new_app_answer
 
     except HTTPException as http:
         raise http
     except Exception as e:
-        session.rollback()
+        await session.rollback()
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST)
 
 
@@ -709,13 +649,15 @@ bot = Bot(token=token)
 
 
 @appeal_router.post('/hakimiyat-appeal', status_code=status.HTTP_200_OK)
-async def hakimiyat_appeal(appeal: AppealHakimiyatSchema, session : Session = Depends(connect), user : User = Depends(verify)):
+async def hakimiyat_appeal(appeal: AppealHakimiyatSchema, session : AsyncSession = Depends(connect), user : User = Depends(verify)):
     try:
         if user.role not in [User_Status.ADMIN, User_Status.CEO]:
             raise HTTPException(status_code=status.HTTP_403_FORBIDDEN)
 
-        check_appeal = session.query(Appeal).filter(Appeal.id == appeal.appeal_id).first()
-        tg_appeal = session.query(TgUserAppeal).filter(TgUserAppeal.id == check_appeal.tg_appeal_id).first()
+        check_appeal = await session.scalar(
+            select(Appeal).options(selectinload(Appeal.mekeme)).where(Appeal.id == appeal.appeal_id)
+        )
+        tg_appeal = await session.scalar(select(TgUserAppeal).where(TgUserAppeal.id == check_appeal.tg_appeal_id))
 
         if check_appeal.appeal_status == Appeal_Status.SUCCESS_DONE or check_appeal.appeal_status == Appeal_Status.TEXT_DONE:
             if appeal.appeal_status is not None:
@@ -735,7 +677,7 @@ async def hakimiyat_appeal(appeal: AppealHakimiyatSchema, session : Session = De
                     user_id=user.id
                 )
                 session.add(tg_history)
-                session.commit()
+                await session.commit()
 
 
 
@@ -775,14 +717,13 @@ async def hakimiyat_appeal(appeal: AppealHakimiyatSchema, session : Session = De
                 if tg_appeal:
                     tg_appeal.tg_appeal_status = TgAppealStatus.DONE
 
-                    tg_user = session.query(Tg_user).filter(Tg_user.tg_user_id == tg_appeal.tg_user_id).first()
+                    tg_user = await session.scalar(select(Tg_user).where(Tg_user.tg_user_id == tg_appeal.tg_user_id))
 
 
-                last_answer = (
-                    session.query(AppealAnswer)
-                    .filter(AppealAnswer.appeal_id == check_appeal.id)
+                last_answer = await session.scalar(
+                    select(AppealAnswer)
+                    .where(AppealAnswer.appeal_id == check_appeal.id)
                     .order_by(AppealAnswer.created_at.desc())
-                    .first()
                 )
 
                 if last_answer is not None and last_answer.report_appeal_user:
@@ -805,7 +746,7 @@ async def hakimiyat_appeal(appeal: AppealHakimiyatSchema, session : Session = De
                     user_id=user.id
                 )
                 session.add(tg_history)
-                session.commit()
+                await session.commit()
 
 
             if appeal.appeal_status == Appeal_Status.REJECTED:
@@ -821,7 +762,7 @@ async def hakimiyat_appeal(appeal: AppealHakimiyatSchema, session : Session = De
                     user_id=user.id
                 )
                 session.add(tg_history)
-                session.commit()
+                await session.commit()
 
 
 
@@ -835,7 +776,7 @@ async def hakimiyat_appeal(appeal: AppealHakimiyatSchema, session : Session = De
             text=appeal.text
         )
         session.add(new_hakim_answer)
-        session.commit()
+        await session.commit()
 
 
         appeal_history = AppealHistory(
@@ -845,14 +786,15 @@ async def hakimiyat_appeal(appeal: AppealHakimiyatSchema, session : Session = De
             text=new_hakim_answer.text
         )
         session.add(appeal_history)
-        session.commit()
+        await session.commit()
+        invalidate('appeal', 'tg_appeal')
 
         return new_hakim_answer
 
     except HTTPException as http:
         raise http
     except Exception as e:
-        session.rollback()
+        await session.rollback()
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST)
 
 
@@ -860,68 +802,99 @@ async def hakimiyat_appeal(appeal: AppealHakimiyatSchema, session : Session = De
 
 
 
+@appeal_router.get('/{id}/timeline', status_code=200)
+async def timeline(
+        id: int,
+        limit: int = Query(50, ge=1, le=200),
+        before: Optional[str] = Query(None),
+        session : AsyncSession = Depends(connect),
+        user : User = Depends(verify)
+):
+    try:
+
+        appeal = (await session.execute(select(Appeal.mekeme_id, Appeal.tg_appeal_id).where(Appeal.id == id))).first()
+        if not appeal:
+            raise HTTPException(status_code=404, detail="Обращение не найдено")
+
+        admin = user.role in [User_Status.CEO, User_Status.ADMIN]
+        if not admin and user.mekeme_id != appeal.mekeme_id:
+            raise HTTPException(status_code=403)
+
+        # telegram history is shown to admins only, like /tg-appeal/history
+        events = timeline_query(id, appeal.tg_appeal_id if admin else None)
+        rows = (await session.execute(timeline_page(events, limit, before))).all()
+
+        data = {
+            "data": [appeal_timeline_item(row) for row in rows],
+            "pagination": {
+                "limit": limit,
+                "next": timeline_cursor(rows, limit)
+            }
+        }
+
+        return ORJSONResponse(data)
+
+    except HTTPException as http:
+        raise http
+    except Exception as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST)
+
+
+
+
 @appeal_router.get('/history/{id}', status_code=200)
-async def history(id: int, session : Session = Depends(connect), user : User = Depends(verify)):
+async def history(id: int, session : AsyncSession = Depends(connect), user : User = Depends(verify)):
     try:
 
         appeals = []
 
         if user.role in [User_Status.CEO, User_Status.ADMIN]:
-            appeals = session.query(AppealHistory).filter(AppealHistory.appeal_id == id).order_by(
-                desc(AppealHistory.id)).all()
+            appeals = (await session.scalars(
+                select(AppealHistory)
+                .options(selectinload(AppealHistory.user).selectinload(User.mekeme))
+                .where(AppealHistory.appeal_id == id)
+                .order_by(desc(AppealHistory.id))
+            )).all()
         elif user.mekeme_id:
-            appeals = (
-                session.query(AppealHistory)
+            appeals = (await session.scalars(
+                select(AppealHistory)
+                .options(selectinload(AppealHistory.user).selectinload(User.mekeme))
                 .join(Appeal, Appeal.id == AppealHistory.appeal_id)
-                .filter(
+                .where(
                     AppealHistory.appeal_id == id,
                     Appeal.mekeme_id == user.mekeme_id
                 )
                 .order_by(desc(AppealHistory.id))
-                .all()
-            )
+            )).all()
 
 
         data = []
         for appeal in appeals:
-            user = session.query(User).filter(User.id == appeal.user_id).first()
-
-
-
-            data.append({
-                "id": appeal.id,
-                "text": appeal.text,
-                "status": appeal.status,
-                "user": f"{user.mekeme.name} - {user.fio}" if user.mekeme_id else user.fio,
-                "user_id": user.id,
-                "time_file" : appeal.time_file,
-                "report_appeal_user": appeal.report_appeal_user if appeal.report_appeal_user else None,
-                "report_government": appeal.report_government if appeal.report_government else None,
-                "report_photo": appeal.report_photo if appeal.report_photo else None,
-                "created": appeal.created_at.strftime("%d.%m.%Y %H:%M"),
-                "message_owned": (user.mekeme_id == user.mekeme_id if user.role in [User_Status.CEO, User_Status.ADMIN] else user.id == user.id)
-
-            })
+            user = appeal.user
+            data.append(dict(
+                appeal_history_item(appeal),
+                message_owned=(user.mekeme_id == user.mekeme_id if user.role in [User_Status.CEO, User_Status.ADMIN] else user.id == user.id)
+            ))
 
-        return jsonable_encoder(data)
+        return ORJSONResponse(data)
 
     except HTTPException as http:
         raise http
     except Exception as e:
-        session.rollback()
+        await session.rollback()
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST)
 
 
 
 
 @appeal_router.patch('/{id}', status_code=status.HTTP_200_OK)
-async def update_appeal(id: int,  appeal: AppealUpdateSchema, session : Session = Depends(connect), user : User = Depends(verify)):
+async def update_appeal(id: int,  appeal: AppealUpdateSchema, session : AsyncSession = Depends(connect), user : User = Depends(verify)):
     try:
 
         if user.role not in [User_Status.ADMIN, User_Status.CEO]:
             raise HTTPException(status_code=status.HTTP_403_FORBIDDEN)
 
-        check_appeal = session.query(Appeal).filter(Appeal.id == id).first()
+        check_appeal = await session.scalar(select(Appeal).where(Appeal.id == id))
 
         for key, value in appeal.dict(exclude_unset=True).items():
             if hasattr(check_appeal, key):
@@ -936,11 +909,12 @@ async def update_appeal(id: int,  appeal: AppealUpdateSchema, session : Session
         )
 
         session.add(appeal_history)
-        session.commit()
+        await session.commit()
+        invalidate('appeal')
         return HTTPException(status_code=status.HTTP_200_OK)
 
     except HTTPException as http_exc:
         raise http_exc
     except Exception as exc:
-        session.rollback()
+        await session.rollback()
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST)
\ No newline at end of file
@@ -1,11 +1,15 @@
-from fastapi import HTTPException, status, Depends, APIRouter
+from fastapi import HTTPException, status, Depends, APIRouter, Request, Query
 from fastapi_jwt_auth import AuthJWT
 from fastapi_jwt_auth.exceptions import InvalidHeaderError
-from passlib.hash import bcrypt
-from backend.database import Session, connect
+from sqlalchemy import select
+from backend.cache import TTLCache
+from backend.password import hash_password, verify_password, needs_rehash
+from backend.database import AsyncSession, connect
 from backend.model import User
-from backend.schema import UserLoginSchema, UserRegisterSchema, UserResponse
+from backend.schema import UserLoginSchema, UserRegisterSchema, UserResponse, CurrentUser
 import datetime
+import os
+from typing import Optional
 
 
 
@@ -13,18 +17,57 @@ import datetime
 auth_router = APIRouter(prefix='/auth', tags=['AUTH'])
 
 
-def verify(Authorization: AuthJWT = Depends(), session: Session = Depends(connect)):
-    try:
-        Authorization.jwt_required()
+# login -> CurrentUser, routers that change role / mekeme_id / is_active must pop the login
+user_cache = TTLCache(
+    maxsize=int(os.getenv('USER_CACHE_SIZE', 1024)),
+    ttl=int(os.getenv('USER_CACHE_TTL', 60))
+)
+
 
-        user_login = Authorization.get_jwt_subject()
-        user = session.query(User).filter(User.login == user_login).first()
+async def current_user(user_login, session):
+    user = user_cache.get(user_login)
 
-        if user is None:
+    if user is None:
+        check_user = await session.scalar(select(User).where(User.login == user_login))
+
+        if check_user is None:
             raise HTTPException(
                 status_code=status.HTTP_401_UNAUTHORIZED
             )
 
+        user = CurrentUser.from_orm(check_user)
+        user_cache.set(user_login, user)
+
+    return user
+
+
+async def verify(request: Request, Authorization: AuthJWT = Depends(), session: AsyncSession = Depends(connect)):
+    try:
+        Authorization.jwt_required()
+
+        user = await current_user(Authorization.get_jwt_subject(), session)
+
+        request.state.user_id = user.id
+        return user
+
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail=str(e)
+        )
+
+
+async def verify_stream(request: Request, token: Optional[str] = Query(None), Authorization: AuthJWT = Depends(), session: AsyncSession = Depends(connect)):
+    # EventSource cannot send headers, the access token may come as ?token= instead
+    try:
+        if token:
+            Authorization.jwt_required("websocket", token=token)
+        else:
+            Authorization.jwt_required()
+
+        user = await current_user(Authorization.get_jwt_subject(), session)
+
+        request.state.user_id = user.id
         return user
 
     except Exception as e:
@@ -36,33 +79,37 @@ def verify(Authorization: AuthJWT = Depends(), session: Session = Depends(connec
 
 
 @auth_router.post('/register', status_code=status.HTTP_201_CREATED)
-async def register(user: UserRegisterSchema, session: Session = Depends(connect)):
-    check_user_login = session.query(User).filter(User.login == user.login).first()
+async def register(user: UserRegisterSchema, session: AsyncSession = Depends(connect)):
+    check_user_login = await session.scalar(select(User).where(User.login == user.login))
     if check_user_login:
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=f"Пользователь с логином {user.login} уже существует")
 
     new_user = User(
         fio=user.fio,
         login=user.login,
-        password=bcrypt.hash(user.password),
+        password=await hash_password(user.password),
         phone=user.phone,
         role=user.role
     )
     session.add(new_user)
-    session.commit()
+    await session.commit()
     return {"message": "Пользователь успешно зарегистрирован"}
 
 
 
 @auth_router.post('/login', status_code=status.HTTP_200_OK)
-async def login(user: UserLoginSchema, session: Session = Depends(connect), Authorize: AuthJWT = Depends()):
-    check_user = session.query(User).filter(User.login == user.login).first()
-    if not check_user or not bcrypt.verify(user.password, check_user.password):
+async def login(user: UserLoginSchema, session: AsyncSession = Depends(connect), Authorize: AuthJWT = Depends()):
+    check_user = await session.scalar(select(User).where(User.login == user.login))
+    if not check_user or not await verify_password(user.password, check_user.password):
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Неверный логин или пароль")
 
     if not check_user.is_active:
         raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail="Аккаунт не активен")
 
+    if needs_rehash(check_user.password):
+        check_user.password = await hash_password(user.password)
+        await session.commit()
+
     access_token = Authorize.create_access_token(subject=check_user.login, expires_time=datetime.timedelta(hours=1))
     refresh_token = Authorize.create_refresh_token(subject=check_user.login, expires_time=datetime.timedelta(hours=3))
 
@@ -1,10 +1,17 @@
+import os
 from fastapi.encoders import jsonable_encoder
-from backend.model import Appeal, User, User_Status, Appeal_Status, Mekeme, TgUserAppeal
-from fastapi import APIRouter, Depends, status, HTTPException
-from backend.database import Session, connect
+from backend.model import Appeal, User, User_Status, Appeal_Status, Mekeme, TgUserAppeal, AppealHistory, appeal_open
+from fastapi import APIRouter, Depends, status, HTTPException, Query
+from backend.database import AsyncSession, connect
 from backend.routers.auth import verify
-from sqlalchemy import  or_, func
+from backend.serializers import ORJSONResponse
+from backend.cache import TTLCache
+from backend.totals import generation
+from backend.rollup import series_query
+from backend.analytics import DONE_STATUSES, resolution_times, percentiles, dwell_times
+from sqlalchemy import  or_, and_, func, select, case
 from datetime import datetime, date, timedelta
+from typing import Literal, Optional
 
 
 
@@ -16,83 +23,209 @@ statistics_router = APIRouter(prefix='/statistics', tags=["STATISTICS"])
 
 
 
+# dashboard counters for one (role, mekeme) scope. writes that move appeals between statuses call
+# totals.invalidate(), which changes the generation part of the key; other worker processes
+# catch up within STATISTICS_CACHE_TTL seconds
+statistics_cache = TTLCache(maxsize=256, ttl=int(os.getenv('STATISTICS_CACHE_TTL', 5)))
+
+
+def count_if(condition):
+    return func.count(case((condition, Appeal.id)))
+
+
+def statistics_query(user):
+    today = date.today()
+
+    yesterday_start = datetime.now() - timedelta(days=1)
+    yesterday_start = datetime.combine(yesterday_start.date(), datetime.min.time())
+    yesterday_end = datetime.combine(yesterday_start.date(), datetime.max.time())
+
+    first_day_of_month = datetime(datetime.now().year, datetime.now().month, 1)
+    next_month = datetime.now().month % 12 + 1
+    year_for_next_month = datetime.now().year if next_month > 1 else datetime.now().year + 1
+    last_day_of_month = datetime(year_for_next_month, next_month, 1) - timedelta(days=1)
+
+    first_day_of_year = datetime(datetime.now().year, 1, 1)
+    last_day_of_year = datetime(datetime.now().year, 12, 31, 23, 59, 59, 999999)
+
+    query = select(
+        func.count(Appeal.id).label('all_appeals'),
+        count_if(Appeal.appeal_status.in_([Appeal_Status.SUCCESS_DONE, Appeal_Status.TEXT_DONE])).label('done_appeals'),
+        count_if(Appeal.appeal_status == Appeal_Status.WAITING).label('waiting_appeals'),
+        count_if(Appeal.appeal_status == Appeal_Status.REJECTED).label('rejected_appeals'),
+        count_if(Appeal.appeal_status == Appeal_Status.TIME_REQUEST).label('time_requests'),
+        count_if(Appeal.appeal_status == Appeal_Status.ARCHIVE).label('archive_appeals'),
+        count_if(Appeal.appeal_status.in_([Appeal_Status.CONFIRM, Appeal_Status.CONFIRM_50])).label('confirm_appeals'),
+        count_if(and_(
+            Appeal.created_at >= datetime.combine(today, datetime.min.time()),
+            Appeal.created_at < datetime.combine(today + timedelta(days=1), datetime.min.time())
+        )).label('today_appeals'),
+        count_if(and_(Appeal.created_at >= yesterday_start, Appeal.created_at <= yesterday_end)).label('yesterday_appeals'),
+        count_if(and_(Appeal.created_at >= first_day_of_month, Appeal.created_at <= last_day_of_month)).label('month_appeals'),
+        count_if(and_(Appeal.created_at >= first_day_of_year, Appeal.created_at <= last_day_of_year)).label('year_appeals'),
+    )
+
+    if user.role in [User_Status.CEO, User_Status.ADMIN]:
+        query = query.add_columns(select(func.count(TgUserAppeal.id)).scalar_subquery().label('tg_appeals'))
+    else:
+        query = query.where(Appeal.mekeme_id == user.mekeme_id)
+
+    return query
+
+
 @statistics_router.get('', status_code=status.HTTP_200_OK)
-async def statistics(session : Session = Depends(connect), user : User = Depends(verify)):
+async def statistics(session : AsyncSession = Depends(connect), user : User = Depends(verify)):
     try:
-        if user.role in [User_Status.CEO, User_Status.ADMIN]:
-            appeals_query = session.query(Appeal)
-        else:
-            appeals_query = session.query(Appeal).filter(Appeal.mekeme_id == user.mekeme_id)
-
-        all_appeals = appeals_query.count()
-        done_appeals = appeals_query.filter(Appeal.appeal_status == Appeal_Status.SUCCESS_DONE).count() + appeals_query.filter(Appeal.appeal_status == Appeal_Status.TEXT_DONE).count()
-        waiting_appeals = appeals_query.filter(Appeal.appeal_status == Appeal_Status.WAITING).count()
-        rejected_appeals = appeals_query.filter(Appeal.appeal_status == Appeal_Status.REJECTED).count()
-        time_request = appeals_query.filter(Appeal.appeal_status == Appeal_Status.TIME_REQUEST).count()
-        archive_appeals = appeals_query.filter(Appeal.appeal_status == Appeal_Status.ARCHIVE).count()
-
-        confirm_appeals = appeals_query.filter(
-            or_(
-                Appeal.appeal_status == Appeal_Status.CONFIRM,
-                Appeal.appeal_status == Appeal_Status.CONFIRM_50
+        admin = user.role in [User_Status.CEO, User_Status.ADMIN]
+        key = (generation('appeal', 'tg_appeal'), admin, None if admin else user.mekeme_id)
+
+        data = statistics_cache.get(key)
+        if data is None:
+            row = (await session.execute(statistics_query(user))).one()
+
+            data = dict(row._mapping)
+            if not admin:
+                data["tg_appeals"] = ""
+
+            statistics_cache.set(key, data)
+
+        return ORJSONResponse(data)
+
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=f"{e}")
+
+
+
+
+
+SERIES_DEFAULT_RANGE = {"day": timedelta(days=29), "week": timedelta(weeks=12), "month": timedelta(days=365)}
+
+
+@statistics_router.get('/series', status_code=status.HTTP_200_OK)
+async def series(
+        granularity: Literal['day', 'week', 'month'] = Query('day'),
+        from_date: Optional[str] = Query(None),
+        to_date: Optional[str] = Query(None),
+        mekeme_id: Optional[int] = Query(None),
+        mahalla_id: Optional[int] = Query(None),
+        session : AsyncSession = Depends(connect),
+        user : User = Depends(verify)
+):
+    try:
+        if user.role not in [User_Status.CEO, User_Status.ADMIN]:
+            mekeme_id = user.mekeme_id
+
+        to_day = datetime.strptime(to_date, "%d.%m.%y").date() if to_date else date.today()
+        from_day = datetime.strptime(from_date, "%d.%m.%y").date() if from_date else to_day - SERIES_DEFAULT_RANGE[granularity]
+
+        rows = (await session.execute(
+            series_query(granularity, session.bind.dialect.name, from_day, to_day, mekeme_id, mahalla_id)
+        )).all()
+
+        periods = {}
+        for row in rows:
+            if not row.count:
+                continue
+            period = periods.setdefault(row.period, {"date": row.period, "total": 0, "statuses": {}})
+            period["total"] += row.count
+            period["statuses"][row.status.value] = row.count
+
+        return ORJSONResponse({"granularity": granularity, "data": list(periods.values())})
+
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=f"{e}")
+
+
+
+
+
+@statistics_router.get('/sla', status_code=status.HTTP_200_OK)
+async def sla(
+        from_date: Optional[str] = Query(None),
+        to_date: Optional[str] = Query(None),
+        session : AsyncSession = Depends(connect),
+        user : User = Depends(verify)
+):
+    try:
+        if user.role not in [User_Status.CEO, User_Status.ADMIN]:
+            raise HTTPException(status_code=status.HTTP_403_FORBIDDEN)
+
+        # open / overdue now, served by the partial index on open appeals
+        open_rows = (await session.execute(
+            select(Appeal.mekeme_id, func.count(Appeal.id), count_if(Appeal.deadline < datetime.now()))
+            .where(appeal_open)
+            .group_by(Appeal.mekeme_id)
+        )).all()
+
+        # first time each appeal was closed, resolved within the requested period
+        resolved_at = func.min(AppealHistory.created_at)
+        resolved_query = (
+            select(Appeal.mekeme_id, Appeal.created_at, resolved_at)
+            .join(AppealHistory, AppealHistory.appeal_id == Appeal.id)
+            .where(AppealHistory.status.in_(DONE_STATUSES))
+            .group_by(Appeal.id, Appeal.mekeme_id, Appeal.created_at)
+        )
+        if from_date:
+            resolved_query = resolved_query.having(resolved_at >= datetime.strptime(from_date, "%d.%m.%y"))
+        if to_date:
+            resolved_query = resolved_query.having(
+                resolved_at <= datetime.strptime(to_date, "%d.%m.%y").replace(hour=23, minute=59, second=59)
             )
-        ).count()
 
-        today = date.today()
-        today_appeals = appeals_query.filter(
-            Appeal.created_at >= datetime.combine(today, datetime.min.time()),
-            Appeal.created_at < datetime.combine(today + timedelta(days=1), datetime.min.time())
-        ).count()
+        resolution = resolution_times((await session.execute(resolved_query)).all())
+        mekemeler = (await session.execute(select(Mekeme.id, Mekeme.name))).all()
 
-        yesterday_start = datetime.now() - timedelta(days=1)
-        yesterday_start = datetime.combine(yesterday_start.date(), datetime.min.time())
-        yesterday_end = datetime.combine(yesterday_start.date(), datetime.max.time())
+        opened = {mekeme_id: (total, overdue) for mekeme_id, total, overdue in open_rows}
+        empty = {"resolved": 0, **percentiles([])}
 
-        yesterday_appeals = appeals_query.filter(
-            Appeal.created_at >= yesterday_start,
-            Appeal.created_at <= yesterday_end
-        ).count()
+        data = []
+        for mekeme in mekemeler:
+            total, overdue = opened.get(mekeme.id, (0, 0))
+            data.append({
+                "mekeme_id": mekeme.id,
+                "mekeme_name": mekeme.name,
+                "open": total,
+                "overdue": overdue,
+                "overdue_ratio": round(overdue / total, 3) if total else 0,
+                **resolution.get(mekeme.id, empty)
+            })
 
+        data.sort(key=lambda row: (row["overdue"], row["open"]), reverse=True)
 
+        return ORJSONResponse(data)
 
-        first_day_of_month = datetime(datetime.now().year, datetime.now().month, 1)
-        next_month = datetime.now().month % 12 + 1
-        year_for_next_month = datetime.now().year if next_month > 1 else datetime.now().year + 1
-        last_day_of_month = datetime(year_for_next_month, next_month, 1) - timedelta(days=1)
+    except HTTPException as http_exc:
+        raise http_exc
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=f"{e}")
 
-        current_month_appeals = appeals_query.filter(
-            Appeal.created_at >= first_day_of_month,
-            Appeal.created_at <= last_day_of_month
-        ).count()
 
 
-        first_day_of_year = datetime(datetime.now().year, 1, 1)
-        last_day_of_year = datetime(datetime.now().year, 12, 31, 23, 59, 59, 999999)
 
-        current_year_appeals = appeals_query.filter(
-            Appeal.created_at >= first_day_of_year,
-            Appeal.created_at <= last_day_of_year
-        ).count()
 
+@statistics_router.get('/dwell', status_code=status.HTTP_200_OK)
+async def dwell(
+        mekeme_id: Optional[int] = Query(None),
+        sector_id: Optional[int] = Query(None),
+        from_date: Optional[str] = Query(None),
+        to_date: Optional[str] = Query(None),
+        session : AsyncSession = Depends(connect),
+        user : User = Depends(verify)
+):
+    try:
+        if user.role not in [User_Status.CEO, User_Status.ADMIN]:
+            mekeme_id = user.mekeme_id
 
-        tg_appeals = session.query(TgUserAppeal).count()
+        await dwell_times.refresh(session)
 
-        data = {
-            "all_appeals": all_appeals,
-            "done_appeals": done_appeals,
-            "waiting_appeals": waiting_appeals,
-            "rejected_appeals": rejected_appeals,
-            "time_requests": time_request,
-            "archive_appeals": archive_appeals,
-            "confirm_appeals": confirm_appeals,
-            "today_appeals": today_appeals,
-            "yesterday_appeals": yesterday_appeals,
-            "month_appeals": current_month_appeals,
-            "year_appeals": current_year_appeals,
-            "tg_appeals" : tg_appeals if user.role in [User_Status.CEO, User_Status.ADMIN] else ""
-        }
+        data = dwell_times.summary(
+            mekeme_id=mekeme_id,
+            sector_id=sector_id,
+            from_date=datetime.strptime(from_date, "%d.%m.%y") if from_date else None,
+            to_date=datetime.strptime(to_date, "%d.%m.%y").replace(hour=23, minute=59, second=59) if to_date else None
+        )
 
-        return jsonable_encoder(data)
+        return ORJSONResponse({"data": data, "history_id": dwell_times.last_id})
 
     except Exception as e:
         raise HTTPException(status_code=400, detail=f"{e}")
@@ -102,7 +235,7 @@ async def statistics(session : Session = Depends(connect), user : User = Depends
 
 
 @statistics_router.get('/mekeme', status_code=status.HTTP_200_OK)
-async def mekeme(session : Session = Depends(connect), user : User = Depends(verify)):
+async def mekeme(session : AsyncSession = Depends(connect), user : User = Depends(verify)):
     try:
 
         if user.role not in [User_Status.CEO, User_Status.ADMIN]:
@@ -110,11 +243,12 @@ async def mekeme(session : Session = Depends(connect), user : User = Depends(ver
 
         mekeme_stats = []
 
-        mekeme_stats = session.query(Mekeme.id, Mekeme.name, func.count(Appeal.id).label('appeal_count')).join(Appeal, Mekeme.id == Appeal.mekeme_id) \
-            .group_by(Mekeme.id, Mekeme.name) \
-            .order_by(func.count(Appeal.id).desc()) \
-            .limit(5) \
-            .all()
+        mekeme_stats = (await session.execute(
+            select(Mekeme.id, Mekeme.name, func.count(Appeal.id).label('appeal_count')).join(Appeal, Mekeme.id == Appeal.mekeme_id)
+            .group_by(Mekeme.id, Mekeme.name)
+            .order_by(func.count(Appeal.id).desc())
+            .limit(5)
+        )).all()
 
         if not mekeme_stats:
             return HTTPException(status_code=404)
@@ -0,0 +1,72 @@
+import os
+import asyncio
+import orjson
+from fastapi import APIRouter, Depends, HTTPException, Request, status
+from fastapi.responses import StreamingResponse
+from backend.database import AsyncSession, AsyncSessionLocal, connect
+from backend.routers.auth import verify_stream, current_user
+from backend.model import User
+from backend.events import event_bus, messages, RESYNC
+
+
+
+
+events_router = APIRouter(prefix='/events', tags=['EVENTS'])
+
+
+HEARTBEAT = float(os.getenv('EVENTS_HEARTBEAT', 15))
+
+
+def sse(name, data):
+    return b'event: ' + name.encode() + b'\ndata: ' + orjson.dumps(data) + b'\n\n'
+
+
+async def refresh_user(subscription):
+    # role, mekeme_id and is_active can change while the stream is open, the user is read again
+    # (through the user cache) on every heartbeat and resync. False ends the stream
+    try:
+        async with AsyncSessionLocal() as session:
+            subscription.user = await current_user(subscription.user.login, session)
+    except HTTPException:
+        return False
+    return bool(subscription.user.is_active)
+
+
+async def event_stream(request, subscription):
+    try:
+        yield b'retry: 5000\n\n'
+
+        while True:
+            try:
+                events = await asyncio.wait_for(subscription.queue.get(), HEARTBEAT)
+            except asyncio.TimeoutError:
+                if await request.is_disconnected() or not await refresh_user(subscription):
+                    break
+                yield b': ping\n\n'
+                continue
+
+            if events == RESYNC:
+                if not await refresh_user(subscription):
+                    break
+                # the client fell behind, it reloads /statistics instead of applying deltas
+                yield sse('resync', {})
+                continue
+
+            for name, data in messages(subscription.user, events):
+                yield sse(name, data)
+
+    finally:
+        event_bus.unsubscribe(subscription)
+
+
+@events_router.get('', status_code=status.HTTP_200_OK)
+async def events(request: Request, session : AsyncSession = Depends(connect), user : User = Depends(verify_stream)):
+    # the connection would otherwise stay checked out for the lifetime of the stream
+    await session.close()
+
+    subscription = event_bus.subscribe(user)
+    return StreamingResponse(
+        event_stream(request, subscription),
+        media_type='text/event-stream',
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
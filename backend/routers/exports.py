@@ -0,0 +1,86 @@
+from fastapi import APIRouter, HTTPException, status, Depends
+from fastapi.responses import FileResponse
+from datetime import datetime
+from backend.database import AsyncSession, connect
+from backend.model import User, User_Status, TgAppealStatus
+from backend.schema import ExportJobSchema
+from backend.routers.auth import verify
+from backend.routers.appeal import parse_date
+from backend.export import APPEAL_COLUMNS, TG_APPEAL_COLUMNS, EXPORT_FORMATS, appeal_export_query, tg_appeal_export_query, has_rows
+from backend.export_jobs import export_jobs, export_key, appeal_fingerprint, tg_appeal_fingerprint, DONE
+
+
+
+
+exports_router = APIRouter(prefix='/exports', tags=['EXPORTS'])
+
+
+
+def export_scope(user):
+    return None if user.role in [User_Status.CEO, User_Status.ADMIN] else user.mekeme_id
+
+
+@exports_router.post('', status_code=status.HTTP_202_ACCEPTED)
+async def create_export(export: ExportJobSchema, session : AsyncSession = Depends(connect), user : User = Depends(verify)):
+    try:
+
+        scope = export_scope(user)
+
+        if export.kind == 'tg_appeal':
+            if scope is not None:
+                raise HTTPException(status_code=status.HTTP_403_FORBIDDEN)
+
+            from_date = datetime.strptime(export.from_date, '%d.%m.%y') if export.from_date else None
+            to_date = datetime.strptime(export.to_date, '%d.%m.%y') if export.to_date else None
+            tg_status = TgAppealStatus(export.status) if export.status else None
+
+            query = tg_appeal_export_query(tg_status, from_date, to_date)
+            columns, filename = TG_APPEAL_COLUMNS, 'tg_appeals'
+            filters = (tg_status, from_date, to_date)
+            fingerprint = tg_appeal_fingerprint
+
+        else:
+            from_date = parse_date(export.from_date).replace(hour=0, minute=0, second=0) if export.from_date else None
+            to_date = parse_date(export.to_date).replace(hour=23, minute=59, second=59) if export.to_date else None
+
+            query = appeal_export_query(scope, export.mekeme_id, from_date, to_date, export.status)
+            columns, filename = APPEAL_COLUMNS, 'appeals'
+            filters = (export.mekeme_id, from_date, to_date, export.status)
+            fingerprint = appeal_fingerprint
+
+        if not await has_rows(session, query):
+            raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Данные не найдены для выгрузки.")
+
+        key = export_key(export.kind, export.format, filters, scope, await fingerprint(session, query))
+        job = export_jobs.submit(key, scope, query, columns, export.format, filename)
+
+        return job.as_dict()
+
+    except HTTPException as http:
+        raise http
+
+    except Exception as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=f"{e}")
+
+
+
+def user_job(id, user):
+    job = export_jobs.get(id)
+    if job is None or job.scope != export_scope(user):
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND)
+    return job
+
+
+@exports_router.get('/{id}', status_code=status.HTTP_200_OK)
+async def export_status(id: str, user : User = Depends(verify)):
+    return user_job(id, user).as_dict()
+
+
+@exports_router.get('/{id}/download', status_code=status.HTTP_200_OK)
+async def download_export(id: str, user : User = Depends(verify)):
+    job = user_job(id, user)
+    if job.status != DONE:
+        raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail=f"Export is {job.status}")
+
+    _, media_type = EXPORT_FORMATS[job.format]
+    return FileResponse(job.path, media_type=media_type, filename=f"{job.filename}.{job.format}")
@@ -1,11 +1,15 @@
-from fastapi import APIRouter, HTTPException, status, Depends, Query
+from fastapi import APIRouter, HTTPException, status, Depends, Query, Request, Response
 from fastapi.encoders import jsonable_encoder
 from fastapi_jwt_auth import AuthJWT
 from backend.model import User_Status, Mahalla, User, Sector
 from backend.routers.auth import verify
 from backend.schema import CreateMahallaSchema, UpdateMahallaSchema, MahallaOption
-from backend.database import Session, connect
-from typing import List
+from backend.database import AsyncSession, connect
+from backend.pagination import paginate, next_cursor
+from backend.etag import counters, make_etag, etag_matches, set_etag, not_modified
+from sqlalchemy import select, func
+from sqlalchemy.orm import selectinload
+from typing import List, Optional
 
 
 mahalla_router = APIRouter(prefix='/mahalla', tags=['MAHALLA'])
@@ -15,7 +19,9 @@ mahalla_router = APIRouter(prefix='/mahalla', tags=['MAHALLA'])
 async def mahallaa(
     page: int = Query(1, ge=1),
     limit: int = Query(10, ge=1),
-    session : Session = Depends(connect),
+    after: Optional[str] = Query(None),
+    count: bool = Query(True),
+    session : AsyncSession = Depends(connect),
     user : User = Depends(verify)
 ):
     try:
@@ -23,15 +29,16 @@ async def mahallaa(
         if user.role not in [User_Status.CEO, User_Status.ADMIN]:
             raise HTTPException(status_code=status.HTTP_403_FORBIDDEN)
 
-        skip = (page - 1) * limit
-
-        total_mahalla = session.query(Mahalla).count()
-        all_mahalla = session.query(Mahalla).offset(skip).limit(limit).all()
+        total_mahalla = await session.scalar(select(func.count(Mahalla.id))) if count else None
+        all_mahalla = (await session.scalars(
+            paginate(select(Mahalla).options(selectinload(Mahalla.sector)), Mahalla.id, limit, page, after, descending=False)
+        )).all()
 
         pagination = {
             "limit" : limit,
             "page" : page,
             "total": total_mahalla,
+            "next": next_cursor(all_mahalla, limit),
         }
 
         data = [
@@ -58,14 +65,19 @@ async def mahallaa(
 
 
 @mahalla_router.get('/option', status_code=status.HTTP_200_OK, response_model=List[MahallaOption])
-async def option(session : Session = Depends(connect), user : User = Depends(verify)):
+async def option(request: Request, response: Response, session : AsyncSession = Depends(connect), user : User = Depends(verify)):
     try:
 
         if user.role not in [User_Status.CEO, User_Status.ADMIN]:
             raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail=f"{user.fio} YOU ARE NOT ADMIN")
 
-        mahallalar = session.query(Mahalla.id, Mahalla.name).all()
+        etag = make_etag('mahalla', *(await counters(session, 'mahalla')))
+        if etag_matches(request, etag):
+            return not_modified(etag)
+
+        mahallalar = (await session.execute(select(Mahalla.id, Mahalla.name))).all()
 
+        set_etag(response, etag)
         return [{"value" : mahalla.id, "label" : mahalla.name} for mahalla in mahallalar]
 
     except HTTPException as http_exc:
@@ -79,12 +91,12 @@ async def option(session : Session = Depends(connect), user : User = Depends(ver
 
 
 @mahalla_router.get('/{id}', status_code=status.HTTP_200_OK)
-async def get_mahalla(id : int, session : Session = Depends(connect), user : User = Depends(verify)):
+async def get_mahalla(id : int, session : AsyncSession = Depends(connect), user : User = Depends(verify)):
     try:
         if user.role not in [User_Status.CEO, User_Status.ADMIN]:
             raise HTTPException(status_code=status.HTTP_403_FORBIDDEN)
 
-        mahalla = session.query(Mahalla).filter(Mahalla.id == id).first()
+        mahalla = await session.scalar(select(Mahalla).where(Mahalla.id == id))
 
         if mahalla is None:
             raise HTTPException(status_code=status.HTTP_404_NOT_FOUND)
@@ -94,7 +106,7 @@ async def get_mahalla(id : int, session : Session = Depends(connect), user : Use
     except HTTPException as http:
         raise http
     except Exception as e:
-        session.rollback()
+        await session.rollback()
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST)
 
 
@@ -103,17 +115,17 @@ async def get_mahalla(id : int, session : Session = Depends(connect), user : Use
 
 
 @mahalla_router.post('', status_code=status.HTTP_201_CREATED)
-async def create_mahalla(mahalla: CreateMahallaSchema, session : Session = Depends(connect), user : User = Depends(verify)):
+async def create_mahalla(mahalla: CreateMahallaSchema, session : AsyncSession = Depends(connect), user : User = Depends(verify)):
     try:
 
         if not user or user.role not in [User_Status.CEO, User_Status.ADMIN]:
             raise HTTPException(status_code=status.HTTP_403_FORBIDDEN)
 
-        sector = session.query(Sector).filter(Sector.id == mahalla.sector_id).first()
+        sector = await session.scalar(select(Sector).where(Sector.id == mahalla.sector_id))
         if not sector:
             raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Sector not found")
 
-        check_mahalla = session.query(Mahalla).filter(Mahalla.name == mahalla.name).first()
+        check_mahalla = await session.scalar(select(Mahalla).where(Mahalla.name == mahalla.name))
 
         if check_mahalla:
             raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail={
@@ -127,7 +139,7 @@ async def create_mahalla(mahalla: CreateMahallaSchema, session : Session = Depen
         )
 
         session.add(new_mahalla)
-        session.commit()
+        await session.commit()
 
         data = {
             "message": f"{new_mahalla.name} created"
@@ -136,7 +148,7 @@ async def create_mahalla(mahalla: CreateMahallaSchema, session : Session = Depen
     except HTTPException as http_exc:
         raise http_exc
     except Exception as e:
-        session.rollback()
+        await session.rollback()
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST)
 
 
@@ -144,20 +156,20 @@ async def create_mahalla(mahalla: CreateMahallaSchema, session : Session = Depen
 
 
 @mahalla_router.patch('/{id}', status_code=status.HTTP_200_OK)
-async def update_mahalla(id: int, mahalla: UpdateMahallaSchema, session : Session = Depends(connect), user : User = Depends(verify)):
+async def update_mahalla(id: int, mahalla: UpdateMahallaSchema, session : AsyncSession = Depends(connect), user : User = Depends(verify)):
     try:
 
         if user.role not in [User_Status.CEO, User_Status.ADMIN]:
             raise HTTPException(status_code=status.HTTP_403_FORBIDDEN)
 
 
-        check_mahalla = session.query(Mahalla).filter(Mahalla.id == id).first()
+        check_mahalla = await session.scalar(select(Mahalla).where(Mahalla.id == id))
 
         if not check_mahalla:
             raise HTTPException(status_code=status.HTTP_404_NOT_FOUND)
 
         if mahalla.name:
-            existing_mahalla = session.query(Mahalla).filter(Mahalla.name == mahalla.name, Mahalla.id != id).first()
+            existing_mahalla = await session.scalar(select(Mahalla).where(Mahalla.name == mahalla.name, Mahalla.id != id))
             if existing_mahalla:
                 raise HTTPException(status_code=status.HTTP_422_UNPROCESSABLE_ENTITY, detail={
                     "message": "already_exists",
@@ -168,14 +180,14 @@ async def update_mahalla(id: int, mahalla: UpdateMahallaSchema, session : Sessio
         for key, value in mahalla.dict(exclude_unset=True).items():
             setattr(check_mahalla, key, value)
 
-        session.commit()
+        await session.commit()
 
         data = {f"{check_mahalla.name} mahalla updated successfully": f"{jsonable_encoder(check_mahalla)}"}
         return jsonable_encoder(data)
     except HTTPException as http_exc:
         raise http_exc
     except Exception as e:
-        session.rollback()
+        await session.rollback()
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST)
 
 
@@ -185,19 +197,19 @@ async def update_mahalla(id: int, mahalla: UpdateMahallaSchema, session : Sessio
 
 
 @mahalla_router.delete('/{id}', status_code=status.HTTP_200_OK)
-async def delete_mahalla(id: int, session : Session = Depends(connect), user : User = Depends(verify)):
+async def delete_mahalla(id: int, session : AsyncSession = Depends(connect), user : User = Depends(verify)):
     try:
 
         if user.role not in [User_Status.CEO, User_Status.ADMIN]:
             raise HTTPException(status_code=status.HTTP_403_FORBIDDEN)
 
-        check_mahalla = session.query(Mahalla).filter(Mahalla.id == id).first()
+        check_mahalla = await session.scalar(select(Mahalla).where(Mahalla.id == id))
 
         if not check_mahalla:
             raise HTTPException(status_code=status.HTTP_404_NOT_FOUND)
 
-        session.delete(check_mahalla)
-        session.commit()
+        await session.delete(check_mahalla)
+        await session.commit()
 
         data = {
             "message" : f"{check_mahalla.name} deleted successfully"
@@ -1,10 +1,15 @@
-from fastapi import APIRouter, HTTPException, status, Depends, Query
+from fastapi import APIRouter, HTTPException, status, Depends, Query, Request, Response
 from fastapi.encoders import jsonable_encoder
 from fastapi_jwt_auth import AuthJWT
 from backend.model import User, User_Status, Mekeme
-from backend.database import Session, connect
-from backend.routers.auth import verify
+from backend.database import AsyncSession, connect
+from sqlalchemy import select, func
+from sqlalchemy.orm import selectinload
+from backend.routers.auth import verify, user_cache
+from backend.pagination import paginate, next_cursor
+from typing import Optional
 from backend.schema import MekemeCreateSchema, MekemeUpdateSchema
+from backend.etag import counters, make_etag, etag_matches, set_etag, not_modified
 
 
 
@@ -13,15 +18,20 @@ mekeme_router = APIRouter(prefix='/mekeme', tags=['MEKEME'])
 
 
 @mekeme_router.get('', status_code=status.HTTP_200_OK)
-async def get_mekeme_all(page : int = Query(1, ge=1),  limit : int = Query(10, ge=1), session : Session = Depends(connect), user : User = Depends(verify)):
+async def get_mekeme_all(
+    page : int = Query(1, ge=1),
+    limit : int = Query(10, ge=1),
+    after : Optional[str] = Query(None),
+    count : bool = Query(True),
+    session : AsyncSession = Depends(connect),
+    user : User = Depends(verify)
+):
     try:
 
         if user.role not in [User_Status.CEO, User_Status.ADMIN]:
             raise HTTPException(status_code=status.HTTP_403_FORBIDDEN)
 
-        skip = (page-1) * limit
-
-        mekemeler = session.query(Mekeme).offset(skip).limit(limit).all()
+        mekemeler = (await session.scalars(paginate(select(Mekeme), Mekeme.id, limit, page, after, descending=False))).all()
 
         data_mekeme = [
             {
@@ -32,11 +42,12 @@ async def get_mekeme_all(page : int = Query(1, ge=1),  limit : int = Query(10, g
             for mekeme in mekemeler
         ]
 
-        all_mekeme = session.query(Mekeme).count()
+        all_mekeme = await session.scalar(select(func.count(Mekeme.id))) if count else None
         pagination = {
             "limit": limit,
             "page" : page,
-            "total" : all_mekeme
+            "total" : all_mekeme,
+            "next" : next_cursor(mekemeler, limit)
         }
 
         data = {
@@ -53,14 +64,19 @@ async def get_mekeme_all(page : int = Query(1, ge=1),  limit : int = Query(10, g
 
 
 @mekeme_router.get('/option', status_code=status.HTTP_200_OK)
-async def option(session : Session = Depends(connect), user : User = Depends(verify)):
+async def option(request: Request, response: Response, session : AsyncSession = Depends(connect), user : User = Depends(verify)):
     try:
 
         if user.role not in [User_Status.CEO, User_Status.ADMIN]:
             raise HTTPException(status_code=status.HTTP_403_FORBIDDEN)
 
-        mekemeler = session.query(Mekeme.id, Mekeme.name).all()
+        etag = make_etag('mekeme', *(await counters(session, 'mekeme')))
+        if etag_matches(request, etag):
+            return not_modified(etag)
+
+        mekemeler = (await session.execute(select(Mekeme.id, Mekeme.name))).all()
 
+        set_etag(response, etag)
         return [{"value" : mekeme.id, "label" : mekeme.name} for mekeme in mekemeler]
 
     except HTTPException as http_exc:
@@ -72,15 +88,15 @@ async def option(session : Session = Depends(connect), user : User = Depends(ver
 
 
 @mekeme_router.get('/{id}', status_code=status.HTTP_200_OK)
-async def get_mekeme_id(id : int, session : Session = Depends(connect), user : User = Depends(verify)):
+async def get_mekeme_id(id : int, session : AsyncSession = Depends(connect), user : User = Depends(verify)):
     try:
 
         if user.role not in [User_Status.CEO, User_Status.ADMIN]:
             raise HTTPException(status_code=status.HTTP_403_FORBIDDEN)
 
-        mekeme = session.query(Mekeme).filter(Mekeme.id == id).first()
+        mekeme = await session.scalar(select(Mekeme).options(selectinload(Mekeme.user)).where(Mekeme.id == id))
 
-        mekeme_user = session.query(User).filter(User.mekeme_id == mekeme.id).all()
+        mekeme_user = (await session.scalars(select(User).where(User.mekeme_id == mekeme.id))).all()
 
         users = mekeme.user
 
@@ -101,13 +117,13 @@ async def get_mekeme_id(id : int, session : Session = Depends(connect), user : U
 
 
 @mekeme_router.post('', status_code=status.HTTP_201_CREATED)
-async def create_mekeme(mekeme: MekemeCreateSchema, session : Session = Depends(connect), user : User = Depends(verify)):
+async def create_mekeme(mekeme: MekemeCreateSchema, session : AsyncSession = Depends(connect), user : User = Depends(verify)):
     try:
 
         if user.role not in [User_Status.CEO, User_Status.ADMIN]:
             raise HTTPException(status_code=status.HTTP_403_FORBIDDEN)
 
-        check_mekeme = session.query(Mekeme).filter(Mekeme.name == mekeme.name).first()
+        check_mekeme = await session.scalar(select(Mekeme).where(Mekeme.name == mekeme.name))
 
         if check_mekeme:
             raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail={
@@ -121,22 +137,26 @@ async def create_mekeme(mekeme: MekemeCreateSchema, session : Session = Depends(
         )
 
         session.add(new_mekeme)
-        session.commit()
+        await session.commit()
 
 
         if mekeme.user_ids:
-            users = session.query(User).filter(
+            users = (await session.scalars(select(User).where(
                 User.id.in_(mekeme.user_ids),
                 User.role == User_Status.USER,
                 User.mekeme_id == None
-            ).all()
+            ))).all()
 
             for user in users:
                 user.mekeme_id = new_mekeme.id
                 user.is_active = True
                 session.add(user)
 
-        session.commit()
+        await session.commit()
+
+        if mekeme.user_ids:
+            for user in users:
+                user_cache.pop(user.login)
 
 
         data = {
@@ -153,16 +173,16 @@ async def create_mekeme(mekeme: MekemeCreateSchema, session : Session = Depends(
 
 
 @mekeme_router.patch('/{id}', status_code=status.HTTP_200_OK)
-async def update_mekeme(id: int, mekeme_schema: MekemeUpdateSchema, session : Session = Depends(connect), user : User = Depends(verify)):
+async def update_mekeme(id: int, mekeme_schema: MekemeUpdateSchema, session : AsyncSession = Depends(connect), user : User = Depends(verify)):
     try:
 
         if user.role not in [User_Status.CEO, User_Status.ADMIN]:
             raise HTTPException(status_code=status.HTTP_403_FORBIDDEN)
 
-        mekeme = session.query(Mekeme).filter(Mekeme.id == id).first()
+        mekeme = await session.scalar(select(Mekeme).where(Mekeme.id == id))
 
         if mekeme.name:
-            check_mekeme = session.query(Mekeme).filter(Mekeme.name == mekeme.name).first()
+            check_mekeme = await session.scalar(select(Mekeme).where(Mekeme.name == mekeme.name))
             if check_mekeme and check_mekeme.id != id:
                 raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail={
                 "message" : "already_exsist",
@@ -175,22 +195,29 @@ async def update_mekeme(id: int, mekeme_schema: MekemeUpdateSchema, session : Se
 
 
         if mekeme.user_ids is not None:
-            old_users = session.query(User).filter(User.mekeme_id == mekeme.id).all()
+            old_users = (await session.scalars(select(User).where(User.mekeme_id == mekeme.id))).all()
 
 
             for user in old_users:
                 user.mekeme_id = None
                 user.is_active = False
 
-            session.commit()
+            await session.commit()
 
-            new_users = session.query(User).filter(User.id.in_(mekeme.user_ids)).all()
+            for user in old_users:
+                user_cache.pop(user.login)
+
+            new_users = (await session.scalars(select(User).where(User.id.in_(mekeme.user_ids)))).all()
             for user in new_users:
                 user.mekeme_id = mekeme.id
                 user.is_active = True
 
 
-        session.commit()
+        await session.commit()
+
+        if mekeme.user_ids is not None:
+            for user in new_users:
+                user_cache.pop(user.login)
 
         data = {
             f"{mekeme.name} updated successfully": f"{mekeme}"
@@ -200,7 +227,7 @@ async def update_mekeme(id: int, mekeme_schema: MekemeUpdateSchema, session : Se
     except HTTPException as http_exc:
         raise http_exc
     except Exception as e:
-        session.rollback()
+        await session.rollback()
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST)
 
 
@@ -208,17 +235,20 @@ async def update_mekeme(id: int, mekeme_schema: MekemeUpdateSchema, session : Se
 
 
 @mekeme_router.delete('/{id}', status_code=status.HTTP_200_OK)
-async def delete(id : int, session : Session = Depends(connect),  user : User = Depends(verify)):
+async def delete(id : int, session : AsyncSession = Depends(connect),  user : User = Depends(verify)):
     try:
 
         if user.role not in [User_Status.CEO, User_Status.ADMIN]:
             raise HTTPException(status_code=status.HTTP_403_FORBIDDEN)
 
-        check_mekeme = session.query(Mekeme).filter(Mekeme.id == id).first()
+        check_mekeme = await session.scalar(select(Mekeme).where(Mekeme.id == id))
+
 
+        await session.delete(check_mekeme)
+        await session.commit()
 
-        session.delete(check_mekeme)
-        session.commit()
+        # users of the deleted mekeme lose their mekeme_id
+        user_cache.clear()
 
         data = {
             "message": f"{check_mekeme.name} deleted successfully"
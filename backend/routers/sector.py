@@ -1,10 +1,12 @@
-from fastapi import APIRouter, HTTPException, status, Depends
+from fastapi import APIRouter, HTTPException, status, Depends, Request, Response
 from fastapi.encoders import jsonable_encoder
 from fastapi_jwt_auth import AuthJWT
 from backend.model import  Sector, User, User_Status
-from backend.database import Session, connect
+from sqlalchemy import select
+from backend.database import AsyncSession, connect
 from backend.routers.auth import verify
 from backend.schema import SectorSchema
+from backend.etag import counters, make_etag, etag_matches, set_etag, not_modified
 
 
 
@@ -16,7 +18,7 @@ sector_router = APIRouter(prefix='/sector', tags=['SECTOR'])
 @sector_router.post('', status_code=status.HTTP_200_OK)
 async def create_sector(
     sector : SectorSchema,
-    session : Session = Depends(connect),
+    session : AsyncSession = Depends(connect),
     user : User = Depends(verify)
 ):
     try:
@@ -29,8 +31,8 @@ async def create_sector(
             name = sector.name
         )
         session.add(new_sector)
-        session.commit()
-        session.refresh(new_sector)
+        await session.commit()
+        await session.refresh(new_sector)
 
 
         data = {"message": f"Sector ID - [{new_sector.id}] created"}
@@ -39,20 +41,20 @@ async def create_sector(
     except HTTPException as http_excep:
         raise http_excep
     except Exception as e:
-        session.rollback()
+        await session.rollback()
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST)
 
 
 
 
 @sector_router.get('', status_code=status.HTTP_200_OK)
-async def sector(session : Session = Depends(connect), user : User = Depends(verify)):
+async def sector(session : AsyncSession = Depends(connect), user : User = Depends(verify)):
     try:
 
         if user.role not in [User_Status.CEO, User_Status.ADMIN]:
             raise HTTPException(status_code=status.HTTP_403_FORBIDDEN)
 
-        sector = session.query(Sector).all()
+        sector = (await session.scalars(select(Sector))).all()
 
         data = [
             {
@@ -73,14 +75,19 @@ async def sector(session : Session = Depends(connect), user : User = Depends(ver
 
 
 @sector_router.get('/option', status_code=status.HTTP_200_OK)
-async def sector(session : Session = Depends(connect), user : User = Depends(verify)):
+async def sector(request: Request, response: Response, session : AsyncSession = Depends(connect), user : User = Depends(verify)):
     try:
 
         if user.role not in [User_Status.CEO, User_Status.ADMIN]:
             raise HTTPException(status_code=status.HTTP_403_FORBIDDEN)
 
-        sectors = session.query(Sector).all()
+        etag = make_etag('sector', *(await counters(session, 'sector')))
+        if etag_matches(request, etag):
+            return not_modified(etag)
 
+        sectors = (await session.scalars(select(Sector))).all()
+
+        set_etag(response, etag)
         return [{"label": f"{sector.name}", "value": str(sector.id)} for sector in sectors]
 
 
@@ -1,9 +1,9 @@
 import os
 import uuid
-from typing import Optional
+from typing import Optional, Literal
 from fastapi import APIRouter,  HTTPException, status, UploadFile, File, Form, Query, Depends
-from sqlalchemy import desc
-from backend.database import Session, connect
+from sqlalchemy import select
+from backend.database import AsyncSession, connect
 from fastapi.encoders import jsonable_encoder
 from fastapi_jwt_auth import AuthJWT
 from backend.model import Tg_user, TgUserAppeal, User, User_Status, TgAppealStatus, TgAppealHistory, Appeal, Appeal_Status, AppealAnswer
@@ -11,6 +11,10 @@ from backend.schema import Tg_User_Schema, TgUserCreateRequest, TgAppealSortSche
 from datetime import datetime
 from .appeal import strip_html_tags
 from .auth import verify
+from backend.pagination import paginate, next_cursor
+from backend.totals import count_total, invalidate
+from backend.search import search_filter, search_rank
+from backend.export import TG_APPEAL_COLUMNS, tg_appeal_export_query, has_rows, export_response
 
 tg_user_router = APIRouter(prefix='/tg-user', tags=['TG_USER'])
 tg_appeal_router = APIRouter(prefix='/tg-appeal', tags=['TG APPEAL'])
@@ -18,10 +22,10 @@ tg_appeal_router = APIRouter(prefix='/tg-appeal', tags=['TG APPEAL'])
 
 
 @tg_user_router.post("/test")
-async def create_tg_user(request: TgUserCreateRequest, session : Session = Depends(connect)):
+async def create_tg_user(request: TgUserCreateRequest, session : AsyncSession = Depends(connect)):
     try:
         tg_user_id = request.tg_user_id
-        user = session.query(Tg_user).filter(Tg_user.tg_user_id == tg_user_id).first()
+        user = await session.scalar(select(Tg_user).where(Tg_user.tg_user_id == tg_user_id))
 
         if user:
             return HTTPException(status_code=status.HTTP_200_OK, detail=f"message : Tg user id - {tg_user_id} already exsist")
@@ -37,9 +41,9 @@ async def create_tg_user(request: TgUserCreateRequest, session : Session = Depen
 
 
 @tg_user_router.post("", status_code=status.HTTP_201_CREATED)
-async def create_tg_user(user: Tg_User_Schema, session : Session = Depends(connect)):
+async def create_tg_user(user: Tg_User_Schema, session : AsyncSession = Depends(connect)):
     try:
-        check_user = session.query(Tg_user).filter(Tg_user.tg_user_id == user.tg_user_id).first()
+        check_user = await session.scalar(select(Tg_user).where(Tg_user.tg_user_id == user.tg_user_id))
         if check_user:
             raise HTTPException(status_code=400, detail=f"User with this {user.tg_user_id} already exists")
 
@@ -48,8 +52,8 @@ async def create_tg_user(user: Tg_User_Schema, session : Session = Depends(conne
             phone=user.phone,
         )
         session.add(new_user)
-        session.commit()
-        session.refresh(new_user)
+        await session.commit()
+        await session.refresh(new_user)
         return new_user
 
     except HTTPException as http:
@@ -75,28 +79,27 @@ bot = Bot(token=TELEGRAM_BOT_TOKEN)
 async def appeal(
     id: int = Query(...),
     appeal_id: Optional[int] = Query(None),
-    session : Session = Depends(connect)
+    session : AsyncSession = Depends(connect)
 ):
     try:
-        tg_appeal = session.query(TgUserAppeal).filter(TgUserAppeal.tg_user_id == id).all()
+        tg_appeal = (await session.scalars(select(TgUserAppeal).where(TgUserAppeal.tg_user_id == id))).all()
 
         tg_appeal_ids = [item.id for item in tg_appeal]
-        appeal = session.query(Appeal).filter(Appeal.tg_appeal_id.in_(tg_appeal_ids)).all()
+        appeal = (await session.scalars(select(Appeal).where(Appeal.tg_appeal_id.in_(tg_appeal_ids)))).all()
 
 
         if appeal_id is not None:
-            check_appeal = session.query(Appeal).filter(Appeal.id == appeal_id).first()
+            check_appeal = await session.scalar(select(Appeal).where(Appeal.id == appeal_id))
 
             if not check_appeal or check_appeal.tg_appeal_id not in tg_appeal_ids:
                 raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Доступ запрещен")
 
 
             if check_appeal.appeal_status == Appeal_Status.DONE:
-                last_answer = (
-                    session.query(AppealAnswer)
-                    .filter(AppealAnswer.appeal_id == check_appeal.id)
+                last_answer = await session.scalar(
+                    select(AppealAnswer)
+                    .where(AppealAnswer.appeal_id == check_appeal.id)
                     .order_by(AppealAnswer.created_at.desc())
-                    .first()
                 )
 
                 if last_answer and last_answer.report_appeal_user:
@@ -192,7 +195,7 @@ async def create_tg_user_appeal(
     mahalla: Optional[str] = Form(None),
     birthday: Optional[str] = Form(None),
     text: Optional[str] = Form(None),
-    session : Session = Depends(connect),
+    session : AsyncSession = Depends(connect),
     file: Optional[UploadFile] = File(None)
 ):
     if file:
@@ -206,7 +209,7 @@ async def create_tg_user_appeal(
             )
 
     try:
-        user = session.query(Tg_user).filter(Tg_user.tg_user_id == tg_user_id).first()
+        user = await session.scalar(select(Tg_user).where(Tg_user.tg_user_id == tg_user_id))
         if not user:
             raise HTTPException(status_code=404, detail=f"TG_USER ID {tg_user_id} not found")
 
@@ -236,8 +239,8 @@ async def create_tg_user_appeal(
             text=text
         )
         session.add(new_appeal)
-        session.commit()
-        session.refresh(new_appeal)
+        await session.commit()
+        await session.refresh(new_appeal)
 
 
         tg_history = TgAppealHistory(
@@ -245,7 +248,8 @@ async def create_tg_user_appeal(
             text="TELEGRAMNAN JAN'A MURAJAAT KELIP TU'STI"
         )
         session.add(tg_history)
-        session.commit()
+        await session.commit()
+        invalidate('tg_appeal')
 
         return jsonable_encoder(new_appeal)
 
@@ -267,7 +271,11 @@ async def get_tg_appeals(
     to_date: Optional[str] = Query(None),
     limit: int = Query(10, ge=1),
     page: int = Query(1, ge=1),
-    session : Session = Depends(connect),
+    search: Optional[str] = Query(None),
+    after: Optional[str] = Query(None),
+    count: bool = Query(True),
+    estimate: bool = Query(False),
+    session : AsyncSession = Depends(connect),
     user : User = Depends(verify)
 ):
     try:
@@ -281,25 +289,24 @@ async def get_tg_appeals(
         to_datetime = datetime.strptime(to_date, '%d.%m.%y') if to_date else None
 
 
-        query = session.query(TgUserAppeal)
+        query = select(TgUserAppeal)
 
 
         if status:
-            query = query.filter(TgUserAppeal.tg_appeal_status == status)
+            query = query.where(TgUserAppeal.tg_appeal_status == status)
         if from_datetime:
-            query = query.filter(TgUserAppeal.created_at >= from_datetime)
+            query = query.where(TgUserAppeal.created_at >= from_datetime)
         if to_datetime:
-            query = query.filter(TgUserAppeal.created_at <= to_datetime)
+            query = query.where(TgUserAppeal.created_at <= to_datetime)
+        if search:
+            query = query.where(search_filter(TgUserAppeal, search, session.bind.dialect.name))
 
 
-        total_tg_appeals = query.count()
+        filters = (status, from_datetime, to_datetime, search)
+        total_tg_appeals = await count_total(session, 'tg_appeal', query, filters, estimate) if count else None
 
 
-        query = query.order_by(desc(TgUserAppeal.id))
-
-
-        skip = (page - 1) * limit
-        appeals = query.offset(skip).limit(limit).all()
+        appeals = (await session.scalars(paginate(query, TgUserAppeal.id, limit, page, after))).all()
 
         list1 = [
             {
@@ -318,7 +325,8 @@ async def get_tg_appeals(
             "pagination": {
                 "total": total_tg_appeals,
                 "limit": limit,
-                "page": page
+                "page": page,
+                "next": next_cursor(appeals, limit)
             }
         }
 
@@ -335,15 +343,98 @@ async def get_tg_appeals(
 
 
 
+@tg_appeal_router.get('/search', status_code=status.HTTP_200_OK)
+async def search_tg_appeals(
+    q: str = Query(..., min_length=2),
+    limit: int = Query(20, ge=1, le=100),
+    session : AsyncSession = Depends(connect),
+    user : User = Depends(verify)
+):
+    try:
+
+        if user.role not in [User_Status.CEO, User_Status.ADMIN]:
+            raise HTTPException(status_code=status.HTTP_403_FORBIDDEN)
+
+        dialect = session.bind.dialect.name
+        rank = search_rank(TgUserAppeal, q, dialect).label('rank')
+
+        appeals = (await session.execute(
+            select(TgUserAppeal, rank)
+            .where(search_filter(TgUserAppeal, q, dialect))
+            .order_by(rank.desc(), TgUserAppeal.id.desc())
+            .limit(limit)
+        )).all()
+
+        data = [
+            {
+                "id": appeal.id,
+                "fio": appeal.fio,
+                "phone": appeal.phone,
+                "text": appeal.text,
+                "tg_appeal_status": appeal.tg_appeal_status,
+                "created_at": appeal.created_at.strftime("%d.%m.%Y %H:%M"),
+                "rank": rank
+            }
+            for appeal, rank in appeals
+        ]
+
+        return jsonable_encoder(data)
+
+    except HTTPException as http:
+        raise http
+
+    except Exception as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST)
+
+
+
+
+
+
+@tg_appeal_router.get('/excel', status_code=status.HTTP_200_OK)
+async def download_tg_appeals(
+    status: Optional[TgAppealStatus] = Query(None),
+    from_date: Optional[str] = Query(None),
+    to_date: Optional[str] = Query(None),
+    format: Literal['xlsx', 'csv', 'parquet'] = Query('xlsx'),
+    session : AsyncSession = Depends(connect),
+    user : User = Depends(verify)
+):
+    try:
+
+        if user.role not in [User_Status.CEO, User_Status.ADMIN]:
+            raise HTTPException(status_code=403)
+
+        from_datetime = datetime.strptime(from_date, '%d.%m.%y') if from_date else None
+        to_datetime = datetime.strptime(to_date, '%d.%m.%y') if to_date else None
+
+        query = tg_appeal_export_query(status, from_datetime, to_datetime)
+
+        if not await has_rows(session, query):
+            raise HTTPException(status_code=404, detail="Данные не найдены для выгрузки.")
+
+        return export_response(query, TG_APPEAL_COLUMNS, format, 'tg_appeals')
+
+    except HTTPException as http:
+        raise http
+
+    except Exception as e:
+        raise HTTPException(status_code=400)
+
+
+
+
+
+
 @tg_appeal_router.get('/{id}', status_code=status.HTTP_200_OK)
-async def get_appeal(id: int, session : Session = Depends(connect), user : User = Depends(verify)):
+async def get_appeal(id: int, session : AsyncSession = Depends(connect), user : User = Depends(verify)):
     try:
 
         if user.role not in [User_Status.CEO, User_Status.ADMIN]:
             raise HTTPException(status_code=status.HTTP_403_FORBIDDEN)
 
-        tg = session.query(TgUserAppeal).filter(TgUserAppeal.id == id).first()
-        appeal = session.query(Appeal).filter(Appeal.tg_appeal_id == tg.id).first()
+        tg = await session.scalar(select(TgUserAppeal).where(TgUserAppeal.id == id))
+        appeal = await session.scalar(select(Appeal).where(Appeal.tg_appeal_id == tg.id))
 
         data =  {
 
@@ -380,13 +471,13 @@ async def get_appeal(id: int, session : Session = Depends(connect), user : User
 
 
 @tg_appeal_router.patch('/sort/{id}', status_code=status.HTTP_200_OK)
-async def sort_appeal(id: int, appeal_sort: TgAppealSortSchema, session : Session = Depends(connect), user : User = Depends(verify)):
+async def sort_appeal(id: int, appeal_sort: TgAppealSortSchema, session : AsyncSession = Depends(connect), user : User = Depends(verify)):
     try:
 
         if user.role not in [User_Status.CEO, User_Status.ADMIN]:
             raise HTTPException(status_code=status.HTTP_403_FORBIDDEN)
 
-        tg_appeal_sort = session.query(TgUserAppeal).filter(TgUserAppeal.id == id).first()
+        tg_appeal_sort = await session.scalar(select(TgUserAppeal).where(TgUserAppeal.id == id))
         if not tg_appeal_sort:
             raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="TgUserAppeal not found")
 
@@ -401,7 +492,8 @@ async def sort_appeal(id: int, appeal_sort: TgAppealSortSchema, session : Sessio
             text=appeal_sort.text
         )
         session.add(tg_history)
-        session.commit()
+        await session.commit()
+        invalidate('tg_appeal')
 
     except HTTPException as http:
         raise http
@@ -419,13 +511,17 @@ async def sort_appeal(id: int, appeal_sort: TgAppealSortSchema, session : Sessio
 
 
 @tg_appeal_router.get('/history/{id}', status_code=status.HTTP_200_OK)
-async def tg_appeal_history(id: int, session : Session = Depends(connect), user : User = Depends(verify)):
+async def tg_appeal_history(id: int, session : AsyncSession = Depends(connect), user : User = Depends(verify)):
     try:
 
         if not user or user.role not in [User_Status.CEO, User_Status.ADMIN]:
             raise HTTPException(status_code=status.HTTP_403_FORBIDDEN)
 
-        history = session.query(TgAppealHistory).filter(TgAppealHistory.tg_appeal_id == id).all()
+        history = (await session.execute(
+            select(TgAppealHistory, User.fio)
+            .outerjoin(User, User.id == TgAppealHistory.user_id)
+            .where(TgAppealHistory.tg_appeal_id == id)
+        )).all()
         if not history:
             raise HTTPException(status_code=status.HTTP_404_NOT_FOUND)
 
@@ -434,12 +530,12 @@ async def tg_appeal_history(id: int, session : Session = Depends(connect), user
             {
                 "id": entry.id,
                 "tg_appeal_id": entry.tg_appeal_id,
-                "user": session.query(User).filter(User.id == entry.user_id).first().fio if entry.user_id else None,
+                "user": fio if entry.user_id else None,
                 "text": entry.text,
                 "status": entry.tg_appeal_status,
                 "date": entry.created_at.strftime("%d.%m.%Y %H:%M"),
             }
-            for entry in history
+            for entry, fio in history
         ]
 
         return jsonable_encoder(data)
@@ -1,12 +1,15 @@
-import bcrypt
-from fastapi import APIRouter, HTTPException, status, Depends, Query
+from fastapi import APIRouter, HTTPException, status, Depends, Query, Request, Response
 from fastapi.encoders import jsonable_encoder
 from fastapi_jwt_auth import AuthJWT
 from backend.model import User, User_Status
-from backend.database import Session, connect
-from backend.routers.auth import verify
+from backend.database import AsyncSession, connect
+from sqlalchemy import select, func
+from sqlalchemy.orm import selectinload
+from backend.routers.auth import verify, user_cache
 from backend.schema import UserRegisterSchema, UserUpdateSchema, UserResponse
-from bcrypt import hashpw, gensalt
+from backend.password import hash_password
+from backend.pagination import paginate, next_cursor
+from backend.etag import counters, make_etag, etag_matches, set_etag, not_modified
 from typing import Optional
 
 
@@ -21,7 +24,9 @@ async def users_all(
     page: int = Query(1, ge=1),
     limit: int = Query(10, ge=1),
     role: Optional[User_Status] = Query(None),
-    session: Session = Depends(connect),
+    after: Optional[str] = Query(None),
+    count: bool = Query(True),
+    session: AsyncSession = Depends(connect),
     user: UserResponse = Depends(verify)
 ):
     try:
@@ -29,21 +34,20 @@ async def users_all(
         if user.role not in [User_Status.CEO, User_Status.ADMIN]:
             raise HTTPException(status_code=status.HTTP_403_FORBIDDEN)
 
-        # Логика пагинации
-        skip = (page - 1) * limit
-
-        query = session.query(User)
+        query = select(User)
 
         if role:
-            query = query.filter(User.role == role)
+            query = query.where(User.role == role)
         else:
-            query = query.filter(User.role != User_Status.CEO)
+            query = query.where(User.role != User_Status.CEO)
 
         if is_active is not None:
-            query = query.filter(User.is_active == ("true" if is_active else "false"))
+            query = query.where(User.is_active == is_active)
 
-        users = query.offset(skip).limit(limit).all()
-        total_users = query.count()
+        users = (await session.scalars(
+            paginate(query.options(selectinload(User.mekeme)), User.id, limit, page, after, descending=False)
+        )).all()
+        total_users = await session.scalar(select(func.count()).select_from(query.subquery())) if count else None
 
         data = [
             {
@@ -60,7 +64,8 @@ async def users_all(
 
         pagination = {
             "total": total_users,
-            "limit": limit
+            "limit": limit,
+            "next": next_cursor(users, limit)
         }
 
         return {"data": data, "pagination": pagination}
@@ -73,44 +78,49 @@ async def users_all(
 
 
 @user_router.get('/option', status_code=status.HTTP_200_OK)
-async def option(session : Session = Depends(connect), user : User = Depends(verify)):
+async def option(request: Request, response: Response, session : AsyncSession = Depends(connect), user : User = Depends(verify)):
     try:
 
         if user is None or user.role not in [User_Status.CEO, User_Status.ADMIN]:
             raise HTTPException(status_code=status.HTTP_403_FORBIDDEN)
 
-        users = session.query(User).filter(
+        etag = make_etag('user', 'mekeme', *(await counters(session, 'user', 'mekeme')))
+        if etag_matches(request, etag):
+            return not_modified(etag)
+
+        users = (await session.scalars(select(User).options(selectinload(User.mekeme)).where(
             User.role == User_Status.USER
-        ).all()
+        ))).all()
 
         data =  [
             {
                 "value": str(user.id),
-                "label": f"{user.fio} {user.mekeme.name if user.mekeme else ""}",
+                "label": f"{user.fio} {user.mekeme.name if user.mekeme else ''}",
             }
             for user in users
         ]
 
+        set_etag(response, etag)
         return jsonable_encoder(data)
 
 
     except HTTPException as http_exc:
         raise http_exc
     except Exception as e:
-        session.rollback()
+        await session.rollback()
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST)
 
 
 
 
 @user_router.get('/{id}', status_code=status.HTTP_200_OK)
-async def user(id : int, session : Session = Depends(connect), user : User = Depends(verify)):
+async def user(id : int, session : AsyncSession = Depends(connect), user : User = Depends(verify)):
     try:
 
         if user.role not in [User_Status.CEO, User_Status.ADMIN]:
             raise HTTPException(status_code=status.HTTP_403_FORBIDDEN)
 
-        check_user = session.query(User).filter(User.id == id).first()
+        check_user = await session.scalar(select(User).where(User.id == id))
 
         data = {
             "id": check_user.id,
@@ -130,14 +140,14 @@ async def user(id : int, session : Session = Depends(connect), user : User = Dep
 
 
 @user_router.post('', status_code=status.HTTP_201_CREATED)
-async def create(user: UserRegisterSchema, session: Session = Depends(connect), user_verify : User = Depends(verify)):
+async def create(user: UserRegisterSchema, session: AsyncSession = Depends(connect), user_verify : User = Depends(verify)):
     try:
 
         if user_verify.role not in [User_Status.CEO, User_Status.ADMIN]:
             raise HTTPException(status_code=status.HTTP_403_FORBIDDEN)
 
-        check_user_login = session.query(User).filter(User.login == user.login).first()
-        check_user_phone = session.query(User).filter(User.phone == user.phone).first()
+        check_user_login = await session.scalar(select(User).where(User.login == user.login))
+        check_user_phone = await session.scalar(select(User).where(User.phone == user.phone))
 
         if check_user_login:
             raise HTTPException(status_code=status.HTTP_422_UNPROCESSABLE_ENTITY, detail={
@@ -151,8 +161,7 @@ async def create(user: UserRegisterSchema, session: Session = Depends(connect),
                 "login": user.phone
             })
 
-        salt = gensalt()
-        hashed_password = hashpw(user.password.encode('utf-8'), salt)
+        hashed_password = await hash_password(user.password)
 
 
         is_active = True if user.role in [User_Status.CEO, User_Status.ADMIN] else False
@@ -160,7 +169,7 @@ async def create(user: UserRegisterSchema, session: Session = Depends(connect),
         new_user = User(
             fio=user.fio,
             login=user.login,
-            password=hashed_password.decode('utf-8'),
+            password=hashed_password,
             phone=user.phone,
             role=user.role,
             is_active=is_active,
@@ -168,7 +177,7 @@ async def create(user: UserRegisterSchema, session: Session = Depends(connect),
         )
 
         session.add(new_user)
-        session.commit()
+        await session.commit()
 
         return {"detail": "User created successfully"}
 
@@ -185,18 +194,19 @@ async def create(user: UserRegisterSchema, session: Session = Depends(connect),
 
 
 @user_router.patch('/{id}', status_code=status.HTTP_200_OK)
-async def update(id: int, user: UserUpdateSchema, session : Session = Depends(connect), user_verify : User = Depends(verify)):
+async def update(id: int, user: UserUpdateSchema, session : AsyncSession = Depends(connect), user_verify : User = Depends(verify)):
     try:
 
         if user_verify.role not in [User_Status.CEO, User_Status.ADMIN]:
             raise HTTPException(status_code=status.HTTP_403_FORBIDDEN)
 
 
-        check_user = session.query(User).filter(User.id == id).first()
+        check_user = await session.scalar(select(User).where(User.id == id))
+        old_login = check_user.login
 
 
         if user.login and user.login != check_user.login:
-            existing_login_user = session.query(User).filter(User.login == user.login).first()
+            existing_login_user = await session.scalar(select(User).where(User.login == user.login))
             if existing_login_user:
                 raise HTTPException(status_code=status.HTTP_422_UNPROCESSABLE_ENTITY, detail={
                     "message": "already_exists",
@@ -204,7 +214,7 @@ async def update(id: int, user: UserUpdateSchema, session : Session = Depends(co
                 })
 
         if user.phone and user.phone != check_user.phone:
-            existing_phone_user = session.query(User).filter(User.phone == user.phone).first()
+            existing_phone_user = await session.scalar(select(User).where(User.phone == user.phone))
             if existing_phone_user:
                 raise HTTPException(status_code=status.HTTP_422_UNPROCESSABLE_ENTITY, detail={
                     "message": "already_exists",
@@ -213,8 +223,7 @@ async def update(id: int, user: UserUpdateSchema, session : Session = Depends(co
 
 
         if user.password:
-            hashed_password = bcrypt.hashpw(user.password.encode('utf-8'), bcrypt.gensalt())
-            check_user.password = hashed_password.decode('utf-8')
+            check_user.password = await hash_password(user.password)
 
 
         for key, value in user.dict(exclude_unset=True).items():
@@ -235,7 +244,9 @@ async def update(id: int, user: UserUpdateSchema, session : Session = Depends(co
             check_user.is_active = True
 
 
-        session.commit()
+        await session.commit()
+        user_cache.pop(old_login)
+        user_cache.pop(check_user.login)
 
         data = {
             f"{check_user.fio} updated": f"{check_user}"
@@ -252,19 +263,20 @@ async def update(id: int, user: UserUpdateSchema, session : Session = Depends(co
 
 
 @user_router.delete('/{id}', status_code=status.HTTP_200_OK)
-async def delete_user(id : int, session : Session = Depends(connect), user : User = Depends(verify)):
+async def delete_user(id : int, session : AsyncSession = Depends(connect), user : User = Depends(verify)):
     try:
 
         if user.role not in [User_Status.CEO, User_Status.ADMIN]:
             raise HTTPException(status_code=status.HTTP_403_FORBIDDEN)
 
-        check_user = session.query(User).filter(User.id == id).first()
+        check_user = await session.scalar(select(User).where(User.id == id))
 
         if not check_user:
             raise HTTPException(status_code=status.HTTP_404_NOT_FOUND)
 
-        session.delete(check_user)
-        session.commit()
+        await session.delete(check_user)
+        await session.commit()
+        user_cache.pop(check_user.login)
 
         data = {
             "message" : f"{check_user.fio} deleted successfully"
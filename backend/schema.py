@@ -1,7 +1,7 @@
 import os
 from dotenv import load_dotenv
 from pydantic import BaseModel
-from typing import Optional, List
+from typing import Optional, List, Literal
 from backend.model import Appeal_Status, User_Status, Gender, TgAppealStatus
 from datetime import date, datetime
 
@@ -27,6 +27,20 @@ class UserResponse(BaseModel):
     mekeme_id : int
 
 
+class CurrentUser(BaseModel):
+    id : int
+    fio : str
+    login : str
+    phone : str
+    role : User_Status
+    mekeme_id : Optional[int]
+    is_active : Optional[bool]
+
+    class Config:
+        orm_mode = True
+        allow_mutation = False
+
+
 class UserRegisterSchema(BaseModel):
     fio : str
     login : str
@@ -192,4 +206,14 @@ class AppealHakimiyatSchema(BaseModel):
 class AppealViewSchema(BaseModel):
     appeal_id : Optional[int]
     user_id : Optional[int]
-    viewed_at : Optional[int]
\ No newline at end of file
+    viewed_at : Optional[int]
+
+
+
+class ExportJobSchema(BaseModel):
+    kind : Literal['appeal', 'tg_appeal'] = 'appeal'
+    format : Literal['xlsx', 'csv', 'parquet'] = 'xlsx'
+    mekeme_id : Optional[int]
+    from_date : Optional[str]
+    to_date : Optional[str]
+    status : Optional[str]
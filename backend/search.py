@@ -0,0 +1,36 @@
+from sqlalchemy import func, or_, text, literal
+from backend.model import Appeal, TgUserAppeal, appeal_search_document, tg_appeal_search_document, search_vector
+
+
+# postgres: tsvector match (word search, ranked) OR ILIKE on the same document (substring, pg_trgm index).
+# other dialects (sqlite in local runs) fall back to a plain case-insensitive LIKE.
+
+DOCUMENTS = {
+    Appeal: appeal_search_document,
+    TgUserAppeal: tg_appeal_search_document,
+}
+
+
+def escape_like(value):
+    return value.replace('/', '//').replace('%', '/%').replace('_', '/_')
+
+
+def _tsquery(q):
+    return func.plainto_tsquery(text("'simple'"), q)
+
+
+def search_filter(model, q, dialect):
+    document = DOCUMENTS[model]
+    condition = document.ilike(f"%{escape_like(q.strip())}%", escape='/')
+
+    if dialect == 'postgresql':
+        condition = or_(search_vector(document).op('@@')(_tsquery(q)), condition)
+
+    return condition
+
+
+def search_rank(model, q, dialect):
+    if dialect != 'postgresql':
+        return literal(0.0)
+
+    return func.ts_rank(search_vector(DOCUMENTS[model]), _tsquery(q))
@@ -0,0 +1,116 @@
+from operator import attrgetter
+from fastapi.responses import ORJSONResponse
+
+
+# hot endpoints return ORJSONResponse(payload) directly: no jsonable_encoder walk and no second
+# encoding pass by FastAPI. orjson writes datetime, date, Enum (as value) and numpy scalars itself.
+# serializers are built once at import from {key: attribute | callable} and reused for every row.
+
+
+def serializer(fields):
+    getters = tuple((key, attrgetter(source) if isinstance(source, str) else source) for key, source in fields.items())
+
+    def serialize(obj):
+        return {key: get(obj) for key, get in getters}
+
+    return serialize
+
+
+def formatted(attribute, fmt):
+    get = attrgetter(attribute)
+
+    def format_value(obj):
+        value = get(obj)
+        return value.strftime(fmt) if value else None
+
+    return format_value
+
+
+def or_none(attribute):
+    get = attrgetter(attribute)
+    return lambda obj: get(obj) or None
+
+
+def name_of(relation):
+    get = attrgetter(relation)
+
+    def name(obj):
+        related = get(obj)
+        return related.name if related else None
+
+    return name
+
+
+# rows of appeal_list_query()
+appeal_list_item = serializer({
+    "id": "id",
+    "address": lambda appeal: f"{appeal.mahalla_name} - {appeal.address}",
+    "deadline": "deadline",
+    "text": "text",
+    "phone": "phone",
+    "appeal_status": "appeal_status",
+    "created_at": formatted("created_at", "%d:%m:%Y %H:%M"),
+    "tg_appeal_id": or_none("tg_appeal_id"),
+    "fio": "fio",
+})
+
+# Appeal with mahalla and mekeme loaded
+appeal_detail = serializer({
+    "id": "id",
+    "fio": "fio",
+    "gender": "gender",
+    "phone": "phone",
+    "doc_series": "doc_series",
+    "doc_num": "doc_num",
+    "address": "address",
+    "birthday": "birthday",
+    "file_path": "file_path",
+    "text": "text",
+    "created_at": "created_at",
+    "updated_at": "updated_at",
+    "mahalla": name_of("mahalla"),
+    "mahalla_id": "mahalla_id",
+    "mekeme": name_of("mekeme"),
+    "mekeme_id": "mekeme_id",
+    "appeal_status": "appeal_status",
+    "deadline": "deadline",
+    "view": "view",
+    "tg_appeal_id": or_none("tg_appeal_id"),
+})
+
+# AppealView with user loaded
+appeal_viewer = serializer({
+    "user_id": "user.id",
+    "user": "user.fio",
+    "time": formatted("viewed_at", "%d-%m-%Y %H:%M"),
+})
+
+# AppealHistory with user and user.mekeme loaded
+appeal_history_item = serializer({
+    "id": "id",
+    "text": "text",
+    "status": "status",
+    "user": lambda history: f"{history.user.mekeme.name} - {history.user.fio}" if history.user.mekeme_id else history.user.fio,
+    "user_id": "user_id",
+    "time_file": "time_file",
+    "report_appeal_user": or_none("report_appeal_user"),
+    "report_government": or_none("report_government"),
+    "report_photo": or_none("report_photo"),
+    "created": formatted("created_at", "%d.%m.%Y %H:%M"),
+})
+
+# rows of timeline_query()
+appeal_timeline_item = serializer({
+    "type": "kind",
+    "id": "id",
+    "text": "text",
+    "status": "status",
+    "user_id": "user_id",
+    "user": "user",
+    "mekeme": "mekeme",
+    "time_file": "time_file",
+    "report_appeal_user": or_none("report_appeal_user"),
+    "report_government": or_none("report_government"),
+    "report_photo": or_none("report_photo"),
+    "created_at": "created_at",
+})
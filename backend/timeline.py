@@ -0,0 +1,91 @@
+from datetime import datetime
+from sqlalchemy import select, union_all, literal_column, cast, null, func, tuple_, String, Integer
+from fastapi import HTTPException, status
+from backend.model import Appeal, AppealHistory, AppealAnswer, AppealHakimiyat, TgAppealHistory, User, Mekeme
+from backend.pagination import encode_keyset, decode_keyset
+
+
+# every event of an appeal as rows of one UNION ALL, authors and mekeme names joined in,
+# newest first and paged by (created_at, kind, id)
+
+def _kind(name):
+    return literal_column(f"'{name}'", String).label('kind')
+
+
+def _none(type_):
+    return cast(null(), type_)
+
+
+def _files(model=None):
+    if model is None:
+        return [_none(String).label(name) for name in ('time_file', 'report_appeal_user', 'report_government', 'report_photo')]
+    return [model.time_file, model.report_appeal_user, model.report_government, model.report_photo]
+
+
+def timeline_query(appeal_id, tg_appeal_id=None):
+    parts = [
+        select(
+            _kind('history'), AppealHistory.id, AppealHistory.created_at, AppealHistory.text,
+            cast(AppealHistory.status, String).label('status'),
+            AppealHistory.user_id, User.fio.label('user'), Mekeme.name.label('mekeme'),
+            *_files(AppealHistory)
+        )
+        .outerjoin(User, User.id == AppealHistory.user_id)
+        .outerjoin(Mekeme, Mekeme.id == User.mekeme_id)
+        .where(AppealHistory.appeal_id == appeal_id),
+
+        select(
+            _kind('answer'), AppealAnswer.id, AppealAnswer.created_at, AppealAnswer.text,
+            _none(String).label('status'),
+            _none(Integer).label('user_id'), _none(String).label('user'), Mekeme.name.label('mekeme'),
+            *_files(AppealAnswer)
+        )
+        .join(Appeal, Appeal.id == AppealAnswer.appeal_id)
+        .outerjoin(Mekeme, Mekeme.id == Appeal.mekeme_id)
+        .where(AppealAnswer.appeal_id == appeal_id),
+
+        select(
+            _kind('hakimiyat'), AppealHakimiyat.id, AppealHakimiyat.created_at, AppealHakimiyat.text,
+            _none(String).label('status'),
+            _none(Integer).label('user_id'), _none(String).label('user'), _none(String).label('mekeme'),
+            *_files()
+        )
+        .where(AppealHakimiyat.appeal_id == appeal_id),
+    ]
+
+    if tg_appeal_id:
+        parts.append(
+            select(
+                _kind('telegram'), TgAppealHistory.id, TgAppealHistory.created_at, TgAppealHistory.text,
+                func.lower(cast(TgAppealHistory.tg_appeal_status, String)).label('status'),
+                TgAppealHistory.user_id, User.fio.label('user'), Mekeme.name.label('mekeme'),
+                *_files()
+            )
+            .outerjoin(User, User.id == TgAppealHistory.user_id)
+            .outerjoin(Mekeme, Mekeme.id == User.mekeme_id)
+            .where(TgAppealHistory.tg_appeal_id == tg_appeal_id)
+        )
+
+    return union_all(*parts).subquery('timeline')
+
+
+def timeline_page(timeline, limit, before=None):
+    key = (timeline.c.created_at, timeline.c.kind, timeline.c.id)
+    query = select(timeline)
+
+    if before:
+        created_at, kind, row_id = decode_keyset(before, 3)
+        try:
+            created_at = datetime.fromisoformat(created_at)
+        except (TypeError, ValueError):
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid cursor")
+        query = query.where(tuple_(*key) < tuple_(created_at, kind, row_id))
+
+    return query.order_by(*(column.desc() for column in key)).limit(limit)
+
+
+def timeline_cursor(rows, limit):
+    if len(rows) < limit:
+        return None
+    last = rows[-1]
+    return encode_keyset(last.created_at, last.kind, last.id)
@@ -0,0 +1,54 @@
+import os
+from sqlalchemy import select, func, text
+from backend.cache import TTLCache
+
+
+# row counts for paginated listings, keyed by table and filter values.
+# every write that can move a row in or out of a filter calls invalidate(table),
+# which bumps the table generation so older entries are never read again
+
+totals_cache = TTLCache(
+    maxsize=int(os.getenv('TOTALS_CACHE_SIZE', 4096)),
+    ttl=int(os.getenv('TOTALS_CACHE_TTL', 30))
+)
+
+_generation = {}
+
+
+def invalidate(*tables):
+    for table in tables:
+        _generation[table] = _generation.get(table, 0) + 1
+
+
+def generation(*tables):
+    return tuple(_generation.get(table, 0) for table in tables)
+
+
+async def estimate_rows(session, table):
+    # planner statistics, only available on postgres and only after ANALYZE
+    if session.bind.dialect.name != 'postgresql':
+        return None
+
+    rows = await session.scalar(
+        text("SELECT reltuples::bigint FROM pg_class WHERE relname = :table"),
+        {"table": table}
+    )
+    return rows if rows is not None and rows >= 0 else None
+
+
+async def count_total(session, table, query, filters, estimate=False):
+    estimate = estimate and all(value is None for value in filters)
+    key = (table, *generation(table), estimate) + tuple(filters)
+
+    total = totals_cache.get(key)
+    if total is not None:
+        return total
+
+    if estimate:
+        total = await estimate_rows(session, table)
+
+    if total is None:
+        total = await session.scalar(select(func.count()).select_from(query.order_by(None).subquery()))
+
+    totals_cache.set(key, total)
+    return total
@@ -0,0 +1,99 @@
+import os
+import asyncio
+import logging
+from datetime import datetime
+from sqlalchemy import select, update, insert
+from backend.database import AsyncSessionLocal
+from backend.model import Appeal, AppealView
+
+
+logger = logging.getLogger(__name__)
+
+
+class ViewBuffer:
+    # write-behind for AppealView: get_appeal only records (appeal_id, user_id) here, a background task
+    # writes them in one multi-row insert per interval and flags the appeals as viewed in one update.
+    # pending views live in memory, so at most one interval of views is lost if the process dies.
+
+    def __init__(self, interval=2.0, maxsize=1000):
+        self.interval = interval
+        self.maxsize = maxsize
+        self._pending = {}
+        self._wakeup = None
+        self._task = None
+
+    def add(self, appeal_id, user_id):
+        viewed_at = self._pending.setdefault((appeal_id, user_id), datetime.now())
+        if len(self._pending) >= self.maxsize and self._wakeup is not None:
+            self._wakeup.set()
+        return viewed_at
+
+    async def flush(self):
+        if not self._pending:
+            return 0
+
+        batch, self._pending = self._pending, {}
+        try:
+            async with AsyncSessionLocal() as session:
+                appeal_ids = {appeal_id for appeal_id, _ in batch}
+                user_ids = {user_id for _, user_id in batch}
+
+                # a pair may already be stored by another worker process
+                existing = set((await session.execute(
+                    select(AppealView.appeal_id, AppealView.user_id)
+                    .where(AppealView.appeal_id.in_(appeal_ids), AppealView.user_id.in_(user_ids))
+                )).all())
+
+                rows = [
+                    {"appeal_id": appeal_id, "user_id": user_id, "viewed_at": viewed_at}
+                    for (appeal_id, user_id), viewed_at in batch.items()
+                    if (appeal_id, user_id) not in existing
+                ]
+                if not rows:
+                    return 0
+
+                await session.execute(insert(AppealView), rows)
+                await session.execute(
+                    update(Appeal)
+                    .where(Appeal.id.in_({row["appeal_id"] for row in rows}))
+                    .values(view=True, version=Appeal.version + 1)
+                    .execution_options(synchronize_session=False)
+                )
+                await session.commit()
+                return len(rows)
+
+        except Exception as e:
+            logger.error(f"AppealView flush failed, {len(batch)} views requeued: {e}")
+            for key, viewed_at in batch.items():
+                self._pending.setdefault(key, viewed_at)
+            return 0
+
+    async def _run(self):
+        while True:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), self.interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            await self.flush()
+
+    def start(self):
+        if self._task is None:
+            self._wakeup = asyncio.Event()
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await self.flush()
+
+
+view_buffer = ViewBuffer(
+    interval=float(os.getenv('VIEW_FLUSH_INTERVAL', 2)),
+    maxsize=int(os.getenv('VIEW_BUFFER_SIZE', 1000))
+)
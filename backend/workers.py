@@ -0,0 +1,101 @@
+import os
+import time
+import asyncio
+import logging
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from fastapi import HTTPException, status
+
+
+logger = logging.getLogger(__name__)
+
+
+class WorkerPool:
+    # CPU-bound document work (reportlab rendering) runs in worker processes, so it holds neither
+    # the event loop nor the GIL of the serving process. functions and arguments must be picklable.
+    # on timeout the caller gets 503; a task that already started keeps its process busy until it
+    # ends, a task still waiting in the queue is dropped. before start() work runs in a thread
+
+    def __init__(self, workers=2, timeout=60):
+        self.workers = workers
+        self.timeout = timeout
+        self._executor = None
+        self.in_flight = 0
+        self.completed = 0
+        self.failed = 0
+        self.timed_out = 0
+        self.busy_seconds = 0.0
+
+    def start(self):
+        if self._executor is None and self.workers > 0:
+            # spawn: a forked child would inherit the event loop, open sockets and pool connections
+            self._executor = ProcessPoolExecutor(
+                max_workers=self.workers,
+                mp_context=multiprocessing.get_context('spawn')
+            )
+
+    def stop(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+    def _report(self, loop, future):
+        # called from the executor's thread
+        try:
+            loop.call_soon_threadsafe(self._finished, future)
+        except RuntimeError:
+            pass
+
+    def _finished(self, future):
+        self.in_flight -= 1
+        if not future.cancelled() and future.exception() is None:
+            self.busy_seconds += future.result()[1]
+
+    async def run(self, fn, *args, timeout=None):
+        if self._executor is None:
+            return await asyncio.to_thread(fn, *args)
+
+        timeout = timeout or self.timeout
+        loop = asyncio.get_running_loop()
+
+        # in_flight drops when the process is really done with the task, not when the caller gives up
+        self.in_flight += 1
+        future = self._executor.submit(timed, fn, args)
+        future.add_done_callback(lambda done: self._report(loop, done))
+
+        try:
+            result, _ = await asyncio.wait_for(asyncio.wrap_future(future), timeout)
+            self.completed += 1
+            return result
+
+        except asyncio.TimeoutError:
+            self.timed_out += 1
+            logger.error(f"{fn.__name__} did not finish in {timeout}s")
+            raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, detail="Document generation timed out")
+
+        except Exception:
+            self.failed += 1
+            raise
+
+    def stats(self):
+        workers = self.workers if self._executor is not None else 0
+        return {
+            "workers": workers,
+            "in_flight": self.in_flight,
+            "queued": max(0, self.in_flight - workers),
+            "completed": self.completed,
+            "failed": self.failed,
+            "timed_out": self.timed_out,
+            "busy_seconds": round(self.busy_seconds, 3),
+        }
+
+
+def timed(fn, args):
+    started = time.monotonic()
+    return fn(*args), time.monotonic() - started
+
+
+worker_pool = WorkerPool(
+    workers=int(os.getenv('DOCUMENT_WORKERS', 2)),
+    timeout=float(os.getenv('DOCUMENT_TIMEOUT', 60))
+)
@@ -0,0 +1,62 @@
+import os
+import tempfile
+
+os.environ.setdefault('DATABASE', 'sqlite:///' + os.path.join(tempfile.mkdtemp(), 'test.sqlite'))
+
+from datetime import datetime
+import pytest
+from backend.database import Base, ENGINE, Session
+from backend.model import Appeal, Appeal_Status, AppealDailyStats
+
+
+@pytest.fixture
+def session():
+    Base.metadata.drop_all(ENGINE)
+    Base.metadata.create_all(ENGINE)
+    with Session() as session:
+        yield session
+
+
+def cells(session):
+    return {
+        (row.day, row.mekeme_id, row.status): row.count
+        for row in session.query(AppealDailyStats) if row.count
+    }
+
+
+def test_update_of_appeal_without_created_at_is_skipped(session):
+    session.execute(Appeal.__table__.insert().values(id=1, fio='Legacy', created_at=None, appeal_status=Appeal_Status.WAITING))
+    session.commit()
+
+    appeal = session.get(Appeal, 1)
+    appeal.appeal_status = Appeal_Status.IN_PROGRESS
+    session.commit()
+
+    assert session.get(Appeal, 1).appeal_status == Appeal_Status.IN_PROGRESS
+    assert cells(session) == {}
+
+
+def test_delete_decrements_cell(session):
+    created_at = datetime(2024, 5, 1, 10, 0)
+    session.add_all([
+        Appeal(id=1, fio='One', created_at=created_at, mekeme_id=None),
+        Appeal(id=2, fio='Two', created_at=created_at, mekeme_id=None),
+    ])
+    session.commit()
+    assert cells(session) == {(created_at.date(), 0, Appeal_Status.WAITING): 2}
+
+    session.delete(session.get(Appeal, 1))
+    session.commit()
+    assert cells(session) == {(created_at.date(), 0, Appeal_Status.WAITING): 1}
+
+
+def test_status_change_before_delete_decrements_old_cell(session):
+    created_at = datetime(2024, 5, 1, 10, 0)
+    session.add(Appeal(id=1, fio='One', created_at=created_at))
+    session.commit()
+
+    appeal = session.get(Appeal, 1)
+    appeal.appeal_status = Appeal_Status.ARCHIVE
+    session.delete(appeal)
+    session.commit()
+    assert cells(session) == {}